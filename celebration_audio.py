@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Rarity sound muxing for SwapDotz celebration videos
+Transcodes the matching assets/SwapSounds clip to a small AAC or Opus track
+in the same ffmpeg pass that encodes the frames, with whoosh.mp3 as a timed
+pre-roll, so the app opens one asset and sound and animation cannot drift
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import celebration_timing as timing
+
+SOUNDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'SwapSounds')
+PREROLL_SOUND = 'whoosh'
+
+# Audio encoder flags; both are plenty for short effect sounds
+AUDIO_CODECS = {
+    'aac': ['-c:a', 'aac', '-b:a', '64k'],
+    'opus': ['-c:a', 'libopus', '-b:a', '48k'],
+}
+
+# Audio codecs each video container can carry (animated WebP/APNG: none)
+CONTAINER_AUDIO = {'.mp4': ('aac', 'opus'), '.webm': ('opus',)}
+
+# Default seconds of whoosh before the burst starts
+PREROLL = 0.5
+
+# Seconds the sound fades out over where it is cut at the end of the video
+FADE_OUT = 0.1
+
+
+def sound_path(name):
+    """Path of a SwapSounds clip, e.g. sound_path('rare')"""
+    return os.path.join(SOUNDS_DIR, f"{name}.mp3")
+
+
+def sound_digest(rarity):
+    """Hash of the sound files a rarity's audio track is made from, for cache keys"""
+    digest = hashlib.sha256()
+    for name in (PREROLL_SOUND, rarity):
+        with open(sound_path(name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def audio_supported(output_path, codec):
+    """True when the output's container can carry the audio codec"""
+    return codec in CONTAINER_AUDIO.get(os.path.splitext(output_path)[1], ())
+
+
+def mux_args(rarity, duration, codec='aac', preroll=PREROLL, fps=30, pad_color='black@0.0'):
+    """ffmpeg flags that add the sound inputs and mix them in with the frames
+
+    Goes in front of the encoder flags of a command whose first input is
+    the frame stream, duration seconds long. The video is padded with
+    `preroll` seconds of pad_color (transparent by default) while the
+    whoosh plays, then the rarity sound starts with the first rendered
+    frame. The mix is cut where the video ends, fading out over FADE_OUT
+    seconds, so a sound longer than the animation cannot stretch the clip.
+    """
+    pad_frames = int(round(preroll * fps))
+    delay = int(round(pad_frames / fps * 1000))
+    end = pad_frames / fps + duration
+    fade = min(FADE_OUT, end)
+    if pad_frames:
+        video = f"[0:v]tpad=start={pad_frames}:start_mode=add:color={pad_color}[v]"
+    else:
+        video = "[0:v]null[v]"
+    audio = (f"[1:a]aresample=48000[whoosh];"
+             f"[2:a]aresample=48000,adelay={delay}:all=1[sound];"
+             f"[whoosh][sound]amix=inputs=2:duration=longest:normalize=0,"
+             f"atrim=end={end:.6f},afade=t=out:st={end - fade:.6f}:d={fade:.6f}[a]")
+    return [
+        '-i', sound_path(PREROLL_SOUND),
+        '-i', sound_path(rarity),
+        '-filter_complex', f"{video};{audio}",
+        '-map', '[v]', '-map', '[a]',
+        *AUDIO_CODECS[codec],
+    ]
+
+
+def first_frame_time(paths, repeats=5):
+    """Best-of-N seconds to open the files and decode the first frame of every stream
+
+    One path is the muxed clip; several model the app starting the video
+    and the sounds as separate players. All paths open in a single ffmpeg
+    process, so both setups pay one process startup and the difference is
+    the extra demuxers and decoders. The same process run on an empty
+    input is subtracted, leaving open and decode time.
+    """
+    def best_of(inputs, maps):
+        best = float('inf')
+        for _ in range(repeats):
+            started = time.perf_counter()
+            subprocess.run(['ffmpeg', '-loglevel', 'error', *inputs, *maps, '-frames:v', '1', '-frames:a', '1',
+                            '-f', 'null', '-'], capture_output=True, timeout=30, check=True)
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    inputs = [arg for path in paths for arg in ('-i', path)]
+    maps = [arg for index in range(len(paths)) for arg in ('-map', str(index))]
+    startup = best_of(['-f', 'lavfi', '-i', 'nullsrc=s=16x16:d=0.04'], [])
+    return max(best_of(inputs, maps) - startup, 0.0)
+
+
+def report_mux(output_path, rarity, timeout=60):
+    """Compare the muxed clip with shipping the video and the sounds separately
+
+    Byte counts and first-frame times are printed and recorded as an
+    'audio' timing stage; the video-only copy is stream-copied to a
+    temporary file. A failed comparison leaves the clip itself alone.
+    """
+    work_dir = tempfile.mkdtemp(prefix="celebration_audio_")
+    try:
+        video_path = os.path.join(work_dir, "video_only" + os.path.splitext(output_path)[1])
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', output_path, '-map', '0:v', '-c', 'copy',
+                        video_path], capture_output=True, timeout=timeout, check=True)
+        sounds = [sound_path(PREROLL_SOUND), sound_path(rarity)]
+        with timing.stage('audio') as record:
+            combined = os.path.getsize(output_path)
+            video = os.path.getsize(video_path)
+            record.update(
+                combined_bytes=combined, video_bytes=video, audio_bytes=combined - video,
+                separate_bytes=video + sum(os.path.getsize(path) for path in sounds),
+                muxed_first_frame=round(first_frame_time([output_path]), 4),
+                separate_first_frame=round(first_frame_time([video_path, *sounds]), 4),
+            )
+        print(f"   Audio: {record['combined_bytes'] / 1024:.1f} KB muxed vs {record['separate_bytes'] / 1024:.1f} KB "
+              f"separate, first frame {record['muxed_first_frame'] * 1000:.0f} ms vs "
+              f"{record['separate_first_frame'] * 1000:.0f} ms")
+        return record
+    except (subprocess.SubprocessError, FileNotFoundError):
+        return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
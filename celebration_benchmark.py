@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Render benchmark for SwapDotz celebration videos
+Sweeps particle count, resolution and frame rate for each renderer backend
+of create_celebration_video, recording wall time, peak RSS of Python and of
+its ffmpeg children, and output bytes as JSON, and fails when throughput
+drops below a stored baseline
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from celebration_cache import ffmpeg_version
+from celebration_farm import parse_resolution
+from celebration_presets import preset_rarities
+
+BACKENDS = ['numpy', 'ffmpeg']
+
+# Default sweep; each axis is swept on its own around the base point
+PARTICLE_COUNTS = [30, 100, 300, 1000, 2000]
+RESOLUTIONS = [(360, 640), (720, 1280), (1080, 1920)]
+FPS_VALUES = [24, 30, 60]
+BASE_POINT = {'particles': 100, 'width': 720, 'height': 1280, 'fps': 30}
+
+# Share of frames-per-second throughput a point may lose against its baseline
+TOLERANCE = 0.2
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+_RSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+
+def point_name(point):
+    """Stable baseline key, e.g. 'numpy/p100/720x1280@30'"""
+    return f"{point['backend']}/p{point['particles']}/{point['width']}x{point['height']}@{point['fps']}"
+
+
+def sweep_points(backends=BACKENDS, counts=PARTICLE_COUNTS, resolutions=RESOLUTIONS, fps_values=FPS_VALUES,
+                 base=BASE_POINT, rarity='rare', presets=None):
+    """Benchmark points: one curve per axis and backend through the base point
+
+    A full grid would be counts x resolutions x frame rates renders per
+    backend; sweeping one axis at a time keeps the run short while still
+    giving each scaling curve.
+    """
+    variations = ([{'particles': count} for count in counts]
+                  + [{'width': width, 'height': height} for width, height in resolutions]
+                  + [{'fps': fps} for fps in fps_values])
+    points = []
+    for backend in backends:
+        for variation in variations:
+            point = dict(base, **variation, backend=backend, rarity=rarity, presets=presets)
+            if point not in points:
+                points.append(point)
+    return points
+
+
+def _measure(point, work_dir):
+    """Worker entry point: render one point in a fresh process and measure it
+
+    Each point gets its own spawned interpreter, so ru_maxrss covers this
+    render alone; RUSAGE_CHILDREN is the largest ffmpeg process it waited on.
+    The frame count comes from the point's scene, so it follows the preset's
+    duration.
+    """
+    from generate_celebration_videos import celebration_scene, create_celebration_video
+
+    scene = celebration_scene(point['rarity'], point['width'], point['height'], fps=point['fps'],
+                              particle_count=point['particles'], presets=point['presets'])
+
+    output_path = os.path.join(work_dir, point_name(point).replace('/', '_') + ".mp4")
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = create_celebration_video(point['rarity'], output_path, renderer=point['backend'],
+                                      width=point['width'], height=point['height'], fps=point['fps'],
+                                      particle_count=point['particles'], presets=point['presets'])
+    wall_time = time.perf_counter() - started
+    output_bytes = os.path.getsize(output_path) if ok and os.path.exists(output_path) else 0
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return {
+        'status': 'ok' if ok else 'failed',
+        'wall_time': round(wall_time, 3),
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_SCALE,
+        'peak_child_rss': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * _RSS_SCALE,
+        'output_bytes': output_bytes,
+        'frames': scene['frame_count'],
+    }
+
+
+def run_point(point, work_dir, repeats=1):
+    """Best-of-N wall time for one point, with the largest RSS seen across runs"""
+    runs = []
+    context = multiprocessing.get_context('spawn')
+    for _ in range(repeats):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            runs.append(pool.submit(_measure, point, work_dir).result())
+    best = min(runs, key=lambda run: (run['status'] != 'ok', run['wall_time']))
+    frames = best['frames']
+    result = dict(point, name=point_name(point), **best)
+    result['peak_rss'] = max(run['peak_rss'] for run in runs)
+    result['peak_child_rss'] = max(run['peak_child_rss'] for run in runs)
+    result['frames_per_second'] = round(frames / best['wall_time'], 2) if best['status'] == 'ok' else 0.0
+    return result
+
+
+def load_baseline(path):
+    """Recorded benchmark points per name, or {} when there is no baseline yet"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    """Baseline points that now fail or lost more than tolerance of their throughput
+
+    Points the baseline has no entry for (including ones that never
+    rendered, like the filter graph at thousands of particles) cannot regress.
+    """
+    found = []
+    for result in results:
+        recorded = baseline.get(result['name'])
+        if not recorded:
+            continue
+        if result['status'] != 'ok':
+            found.append(f"{result['name']}: render failed")
+        elif result['frames_per_second'] < recorded['frames_per_second'] * (1 - tolerance):
+            found.append(f"{result['name']}: {result['frames_per_second']} fps < baseline "
+                         f"{recorded['frames_per_second']} fps")
+    return found
+
+
+def print_curves(results):
+    """One line per point, grouped by backend"""
+    for backend in dict.fromkeys(result['backend'] for result in results):
+        print(f"\n{backend}:")
+        for result in results:
+            if result['backend'] != backend:
+                continue
+            marker = "✅" if result['status'] == 'ok' else "❌"
+            print(f"  {marker} {result['particles']:>5} particles {result['width']}x{result['height']}"
+                  f"@{result['fps']}: {result['wall_time']:.2f}s, {result['frames_per_second']:.1f} fps, "
+                  f"RSS {result['peak_rss'] / 2**20:.0f} MB + ffmpeg {result['peak_child_rss'] / 2**20:.0f} MB, "
+                  f"{result['output_bytes'] / 1024:.1f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark celebration video rendering")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS,
+                        help="Renderer backends to sweep (default: all)")
+    parser.add_argument("--particles", nargs="+", type=int, default=PARTICLE_COUNTS,
+                        help="Particle counts to sweep")
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution, default=RESOLUTIONS, metavar="WxH",
+                        help="Resolutions to sweep")
+    parser.add_argument("--fps", nargs="+", type=int, default=FPS_VALUES, help="Frame rates to sweep")
+    parser.add_argument("--presets", default=None,
+                        help="Rarity preset file, JSON or TOML (default: celebration_presets.json)")
+    parser.add_argument("--rarity", default='rare',
+                        help="Rarity whose effects are drawn, from the preset file (default: rare)")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per point; the fastest counts")
+    parser.add_argument("--output-dir", default="celebration_benchmark",
+                        help="Directory for the report and the default baseline")
+    parser.add_argument("--baseline", default=None,
+                        help="Baseline points (default: <output-dir>/benchmark_baseline.json); "
+                             "points without an entry record one")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"Throughput share a point may lose against the baseline (default: {TOLERANCE})")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Record this run as the new baseline")
+    args = parser.parse_args()
+
+    # Rarities come from the preset file, so they can only be checked once it is known
+    try:
+        known = preset_rarities('celebration', args.presets)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return False
+    if args.rarity not in known:
+        print(f"❌ No celebration preset for {args.rarity} (have: {', '.join(known)})")
+        return False
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    baseline_path = args.baseline or os.path.join(args.output_dir, "benchmark_baseline.json")
+    baseline = {} if args.update_baseline else load_baseline(baseline_path)
+    points = sweep_points(args.backends, args.particles, args.resolutions, args.fps, rarity=args.rarity,
+                          presets=args.presets)
+    print(f"Benchmarking {len(points)} point(s)...")
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="celebration_benchmark_") as work_dir:
+        results = [run_point(point, work_dir, args.repeats) for point in points]
+    print_curves(results)
+
+    found = regressions(results, baseline, args.tolerance)
+    report = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'ffmpeg': ffmpeg_version(),
+        'cpu_count': os.cpu_count(),
+        'wall_time': round(time.perf_counter() - started, 3),
+        'tolerance': args.tolerance,
+        'points': results,
+        'regressions': found,
+    }
+    report_path = os.path.join(args.output_dir, "benchmark.json")
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    recorded = {result['name']: result for result in results if result['status'] == 'ok'}
+    if any(name not in baseline for name in recorded):
+        with open(baseline_path, 'w') as f:
+            json.dump(dict(recorded, **baseline), f, indent=2)
+        print(f"\nBaseline written to: {baseline_path}")
+    print(f"Report written to: {report_path}")
+    for regression in found:
+        print(f"❌ {regression}")
+    return not found
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
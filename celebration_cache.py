@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Content-addressed render cache for SwapDotz celebration videos
+Outputs are stored under a hash of every render input, so an unchanged
+preset is served from the cache instead of being re-encoded
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+import celebration_timing as timing
+
+# Bump when the rendering math changes in a way the inputs do not capture;
+# 5 drops tuned entries stored without the tuner's choice
+CACHE_VERSION = 5
+
+# Timing stages that describe a cached file (the tuner's chosen
+# codec/preset/CRF, the parity scores of its frames); stored next to the
+# entry and replayed on a hit
+ENTRY_STAGES = ('tune', 'parity')
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_version():
+    """First line of `ffmpeg -version`, looked up once per process"""
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, timeout=10)
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return 'unavailable'
+    return result.stdout.splitlines()[0] if result.stdout else 'unknown'
+
+
+def render_key(**inputs):
+    """Hash all render inputs (plus cache and ffmpeg versions) into a cache key"""
+    inputs = dict(inputs, cache_version=CACHE_VERSION, ffmpeg=ffmpeg_version())
+    payload = json.dumps(inputs, sort_keys=True, default=_jsonable, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _jsonable(value):
+    """Serialize NumPy arrays and scalars for hashing"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Cannot hash render input of type {type(value).__name__}")
+
+
+def _publish(cached_path, output_path):
+    """Copy a cached file to output_path
+
+    A copy, not a hard link: an uncached render later writes output_path in
+    place, and through a link it would rewrite the cache entry too. The
+    copy lands under a temporary name and is renamed over output_path.
+    """
+    stem, ext = os.path.splitext(output_path)
+    tmp_path = f"{stem}.{os.getpid()}.tmp{ext}"
+    try:
+        shutil.copy2(cached_path, tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def cached_render(key, output_path, cache_dir, render):
+    """Serve output_path from the cache, or call render(path) to fill it
+
+    render receives a temporary path inside the cache directory and returns
+    True on success. With cache_dir=None it renders straight to output_path.
+    The render's ENTRY_STAGES records are kept in a .json beside the entry
+    and recorded again, marked cached, whenever the entry is served.
+    """
+    if cache_dir is None:
+        return render(output_path)
+
+    ext = os.path.splitext(output_path)[1]
+    cached_path = os.path.join(cache_dir, key + ext)
+    stages_path = os.path.join(cache_dir, key + '.json')
+    if os.path.exists(cached_path):
+        _publish(cached_path, output_path)
+        print(f"♻️  Cache hit for {os.path.basename(output_path)} ({key[:12]})")
+        if os.path.exists(stages_path):
+            with open(stages_path) as f:
+                for record in json.load(f):
+                    fields = {name: value for name, value in record.items() if name not in ('stage', 'seconds')}
+                    with timing.stage(record['stage'], **dict(fields, cached=True)):
+                        pass
+        return True
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Keep the real extension last so ffmpeg still picks the right muxer
+    tmp_path = os.path.join(cache_dir, f"{key}.{os.getpid()}.tmp{ext}")
+    before = len(timing.recorded())
+    try:
+        if not render(tmp_path):
+            return False
+        stages = [record for record in timing.recorded()[before:] if record['stage'] in ENTRY_STAGES]
+        if stages:
+            with open(stages_path, 'w') as f:
+                json.dump(stages, f)
+        os.replace(tmp_path, cached_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _publish(cached_path, output_path)
+    return True
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Parallel render farm for SwapDotz celebration assets
+Fans every (rarity x resolution x seed x codec) job out over a process pool
+and writes a results manifest
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import celebration_timing as timing
+from celebration_audio import AUDIO_CODECS, PREROLL
+from celebration_ffmpeg import CODECS, PRESETS, decode_time, ladder_output_path, parse_tier
+from celebration_parity import (FLUTTER_SEED, MIN_PSNR, MIN_SSIM, PAINTERS, PSNR_TOLERANCE, SSIM_TOLERANCE,
+                                load_baseline, parity_regressions, summary as parity_summary)
+from celebration_posters import poster_paths
+from celebration_presets import preset_rarities
+from celebration_trajectories import load_time as trajectory_load_time, trajectory_path
+from celebration_tuner import parse_size
+
+def parse_resolution(value):
+    """Parse 'WIDTHxHEIGHT' into an (int, int) tuple"""
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def parse_budget(value):
+    """Parse a size budget 'SIZE' or 'RARITY=SIZE' into (rarity or None, bytes)"""
+    rarity, _, size = value.rpartition('=')
+    try:
+        return rarity or None, parse_size(size)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad size {size!r}") from None
+
+
+def add_farm_arguments(parser, default_seed, parity=False):
+    """Register the job-matrix options shared by both generator scripts"""
+    parser.add_argument("--presets", default=None,
+                        help="Rarity preset file, JSON or TOML (default: celebration_presets.json)")
+    parser.add_argument("--rarities", nargs="+", default=None,
+                        help="Rarities to render (default: every rarity in the preset file)")
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution, default=[(720, 1280)],
+                        metavar="WxH", help="Output resolutions (default: 720x1280)")
+    parser.add_argument("--seeds", nargs="+", type=int, default=[default_seed],
+                        help="Particle seeds to render")
+    parser.add_argument("--variants", type=int, default=None, metavar="K",
+                        help="Render K reproducible seed variants per rarity, counting up from the first --seeds value")
+    parser.add_argument("--codecs", nargs="+", choices=sorted(CODECS), default=["h264"],
+                        help="Output codecs (default: h264)")
+    parser.add_argument("--crf", type=int, default=None,
+                        help="Override the script's CRF (x264 scale, mapped for other codecs)")
+    parser.add_argument("--preset", choices=list(PRESETS), default=None,
+                        help="Override the script's encoder preset (x264 names)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Maximum concurrent render jobs (default: cores / --threads)")
+    parser.add_argument("--threads", type=int, default=2,
+                        help="FFmpeg threads per job (default: 2)")
+    parser.add_argument("--manifest", default=None,
+                        help="Results manifest path (default: <output-dir>/render_manifest.json)")
+    parser.add_argument("--timing-report", default=None,
+                        help="Per-stage timing JSON (default: <output-dir>/render_timing.json)")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="Split each clip into N GOP-aligned slices encoded in parallel")
+    parser.add_argument("--ladder", nargs="+", type=parse_tier, default=None, metavar="WxH@FPS[:LOD]",
+                        help="Render once and encode every tier, e.g. 360x640@24:0.5 720x1280@30")
+    parser.add_argument("--trajectories", action="store_true",
+                        help="Also write <name>.sdzt particle trajectories for in-app replay")
+    parser.add_argument("--poster-at", type=float, default=None, metavar="PROGRESS",
+                        help="Write a poster and blurred placeholder at this clip progress (0..1)")
+    parser.add_argument("--vfr-threshold", type=float, default=None, metavar="DELTA",
+                        help="Drop frames whose worst 32px tile differs from the last kept frame by at most "
+                             "DELTA (mean 8-bit levels) into a variable-frame-rate output")
+    parser.add_argument("--audio", choices=sorted(AUDIO_CODECS), default=None,
+                        help="Mux the rarity sound, after a whoosh pre-roll, into each clip")
+    parser.add_argument("--audio-preroll", type=float, default=PREROLL, metavar="SECONDS",
+                        help=f"Seconds of whoosh before the burst starts (default: {PREROLL})")
+    parser.add_argument("--size-budget", nargs="+", type=parse_budget, default=None, metavar="[RARITY=]SIZE",
+                        help="Tune the encoder per asset to fit a size budget, e.g. rare=300K common=80K")
+    parser.add_argument("--min-ssim", type=float, default=0.98,
+                        help="SSIM every frame of the tuned encode must reach (default: 0.98)")
+    parser.add_argument("--tune-codecs", nargs="+", choices=sorted(CODECS), default=None,
+                        help="Codecs the tuner may pick (default: the job's codec; same container only)")
+    parser.add_argument("--tune-presets", nargs="+", choices=list(PRESETS), default=["fast", "slow"],
+                        help="Presets the tuner tries (default: fast slow)")
+    if parity:
+        parser.add_argument("--parity", action="store_true",
+                            help="Score every raw frame against the Flutter painters; fail below the marks, "
+                                 "on regressions or when a job cannot be scored")
+        parser.add_argument("--parity-baseline", default=None,
+                            help="Parity scores per job (default: <output-dir>/parity_baseline.json); "
+                                 "passing jobs without an entry record one")
+        parser.add_argument("--parity-min-ssim", type=float, default=MIN_SSIM,
+                            help=f"Lowest per-frame SSIM a render may score (default: {MIN_SSIM})")
+        parser.add_argument("--parity-min-psnr", type=float, default=MIN_PSNR,
+                            help=f"Lowest per-frame PSNR in dB a render may score (default: {MIN_PSNR})")
+        parser.add_argument("--parity-tolerance", type=float, default=SSIM_TOLERANCE,
+                            help=f"SSIM drop below the baseline that fails a job (default: {SSIM_TOLERANCE})")
+        parser.add_argument("--parity-psnr-tolerance", type=float, default=PSNR_TOLERANCE,
+                            help=f"PSNR drop in dB below the baseline that fails a job (default: {PSNR_TOLERANCE})")
+        parser.add_argument("--update-parity-baseline", action="store_true",
+                            help="Record this run's parity scores as the new baseline")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Render and frame cache directory (default: <output-dir>/.render_cache)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always re-render, bypassing the render cache")
+
+
+def build_jobs(render, output_dir, rarities, resolutions, seeds, codecs, threads=None, **options):
+    """Expand the job matrix into picklable job dicts
+
+    Axes with a single value are left out of the file name, so the default
+    matrix still writes <rarity>_celebration.mp4.
+    """
+    jobs = []
+    for rarity, (width, height), seed, codec in itertools.product(rarities, resolutions, seeds, codecs):
+        parts = [rarity]
+        if len(resolutions) > 1:
+            parts.append(f"{width}x{height}")
+        if len(seeds) > 1:
+            parts.append(f"seed{seed}")
+        if len(codecs) > 1:
+            parts.append(codec)
+        name = "_".join(parts)
+        jobs.append({
+            'name': name,
+            'render': render,
+            'rarity': rarity,
+            'output_path': os.path.join(output_dir, f"{name}_celebration{CODECS[codec]['ext']}"),
+            'kwargs': dict(options, width=width, height=height, seed=seed, codec=codec, threads=threads),
+        })
+    return jobs
+
+
+def default_workers(threads_per_job):
+    """Cap concurrency so the ffmpeg threads of all jobs fit on the machine"""
+    return max(1, (os.cpu_count() or 1) // max(1, threads_per_job or 1))
+
+
+def job_workers(concurrent_jobs, threads_per_job):
+    """Processes one job may start for its own pools (segments, tuner trials)
+
+    The cores left for each of concurrent_jobs once their ffmpeg threads
+    are counted; 1 keeps the job's work in its own process.
+    """
+    return max(1, default_workers(threads_per_job) // max(1, concurrent_jobs))
+
+
+def _run_job(job):
+    """Worker entry point: render one job and time it"""
+    timing.collect()  # drop stages left over from an earlier job in this worker
+    started = time.perf_counter()
+    error = None
+    try:
+        ok = bool(job['render'](job['rarity'], job['output_path'], **job['kwargs']))
+    except Exception as exc:  # keep the farm running when one job crashes
+        ok = False
+        error = f"{type(exc).__name__}: {exc}"
+    wall_time = time.perf_counter() - started
+    output = job['output_path']
+    result = {
+        'name': job['name'],
+        'rarity': job['rarity'],
+        'output': output,
+        'status': 'ok' if ok else 'failed',
+        'wall_time': round(wall_time, 3),
+        'output_bytes': os.path.getsize(output) if ok and os.path.exists(output) else 0,
+    }
+    ladder = job['kwargs'].get('ladder')
+    if ladder:
+        result['tiers'] = [
+            dict(tier, output=path, output_bytes=os.path.getsize(path) if ok and os.path.exists(path) else 0)
+            for tier, path in ((tier, ladder_output_path(output, tier)) for tier in ladder)
+        ]
+        result['output_bytes'] = sum(tier['output_bytes'] for tier in result['tiers'])
+    result.update({key: value for key, value in job['kwargs'].items() if key in ('width', 'height', 'seed', 'codec')})
+    codec = job['kwargs'].get('codec', 'h264')
+    result['alpha'] = CODECS[codec]['alpha']
+    if ok:
+        try:
+            decoded = [tier['output'] for tier in result['tiers']] if ladder else [output]
+            with timing.stage('decode_check'):
+                result['decode_time'] = round(sum(decode_time(path, codec) for path in decoded), 3)
+        except (subprocess.SubprocessError, FileNotFoundError) as exc:
+            error = f"decode check failed: {exc}"
+    if ok and job['kwargs'].get('trajectories'):
+        path = trajectory_path(output)
+        result['trajectory_bytes'] = os.path.getsize(path)
+        result['trajectory_load_time'] = round(trajectory_load_time(path), 6)
+    if ok and job['kwargs'].get('poster_at') is not None:
+        # The filter-graph renderer writes no posters
+        result['posters'] = {kind: {'path': path, 'bytes': os.path.getsize(path)}
+                             for kind, path in zip(('poster', 'placeholder'), poster_paths(output))
+                             if os.path.exists(path)}
+    parity = job.get('parity')
+    if ok and parity:
+        # Scored by the render from the frames it encoded; a skipped or broken
+        # check gets its own status, so it never reads as a pass
+        scored = [record for record in timing.recorded() if record['stage'] == 'parity']
+        report = {key: value for key, value in scored[-1].items() if key not in ('stage', 'seconds')} if scored else None
+        if report is None:
+            result['status'] = 'parity_skipped'
+            error = "parity not measured: ladders, parallel slices and the filter graph are not scored"
+        elif 'error' in report:
+            result['status'] = 'parity_error'
+            error = f"parity check failed: {report['error']}"
+        else:
+            report['regressions'] = parity_regressions(report, parity['baseline'] or {},
+                                                       parity['ssim_tolerance'], parity['psnr_tolerance'])
+            # 'passed' is the whole gate: the absolute marks and the baseline
+            below = not (report['frames'] and report['min_ssim'] >= parity['min_ssim']
+                         and report['min_psnr'] >= parity['min_psnr'])
+            report['passed'] = not below and not report['regressions']
+            result['parity'] = report
+            if below:
+                result['status'] = 'failed'
+                error = (f"parity below the marks: SSIM {report['min_ssim']:.4f} (min {parity['min_ssim']}), "
+                         f"PSNR {report['min_psnr']:.1f} dB (min {parity['min_psnr']})")
+            elif report['regressions']:
+                result['status'] = 'failed'
+                error = "parity dropped: " + "; ".join(report['regressions'])
+    if error:
+        result['error'] = error
+    result['stages'] = timing.collect()
+    vfr = [record for record in result['stages'] if record['stage'] == 'vfr' and 'vfr_bytes' in record]
+    if vfr:
+        result['vfr'] = {key: value for key, value in vfr[-1].items() if key not in ('stage', 'seconds')}
+    audio = [record for record in result['stages'] if record['stage'] == 'audio' and 'combined_bytes' in record]
+    if audio:
+        result['audio'] = {key: value for key, value in audio[-1].items() if key not in ('stage', 'seconds')}
+    tune = [record for record in result['stages'] if record['stage'] == 'tune']
+    if tune:
+        result['tune'] = {key: value for key, value in tune[-1].items() if key not in ('stage', 'seconds')}
+        if tune[-1].get('chosen'):
+            result['codec'] = tune[-1]['chosen']['codec']
+    return result
+
+
+def variant_seeds(args):
+    """Seeds to render: --variants K counts up from the first --seeds value"""
+    if args.variants:
+        return list(range(args.seeds[0], args.seeds[0] + args.variants))
+    return list(args.seeds)
+
+
+def attach_variants(jobs, variants):
+    """Fill in per-seed kwargs made by a variants(rarity, width, height, seeds) hook
+
+    The hook runs once per rarity and size in this process, so the particle
+    arrays of every seed come out of one vectorized block instead of each
+    worker drawing its own; jobs that already carry a value keep it.
+    """
+    groups = {}
+    for job in jobs:
+        kwargs = job['kwargs']
+        groups.setdefault((job['rarity'], kwargs['width'], kwargs['height']), []).append(job)
+    for (rarity, width, height), group in groups.items():
+        seeds = sorted({job['kwargs']['seed'] for job in group})
+        per_seed = dict(zip(seeds, variants(rarity, width, height, seeds)))
+        for job in group:
+            for name, value in per_seed[job['kwargs']['seed']].items():
+                job['kwargs'].setdefault(name, value)
+
+
+def run_jobs(jobs, max_workers, manifest_path, seeds=None):
+    """Run all jobs on a process pool and write the results manifest
+
+    Every job runs even if an earlier one fails; returns the result list
+    in job order. seeds ({rarity: [seed, ...]}) is recorded so a batch of
+    variants can be reproduced.
+    """
+    started = time.perf_counter()
+    results = {}
+    if max_workers <= 1 or len(jobs) <= 1:
+        for index, job in enumerate(jobs):
+            results[index] = _run_job(job)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_run_job, job): index for index, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+    ordered = [results[index] for index in range(len(jobs))]
+
+    manifest = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'workers': max_workers,
+        'wall_time': round(time.perf_counter() - started, 3),
+        'seeds': seeds or {},
+        'jobs': ordered,
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return ordered
+
+
+def run_farm(render, args, generator='celebration', variants=None, **options):
+    """Build the job matrix from parsed CLI args, run it and print a summary
+
+    Rarities come from the generator's section of the preset file.
+    variants is the generator's seed batch hook (see attach_variants); it is
+    skipped for ladders, which render at the top tier's size instead.
+    """
+    try:
+        known = preset_rarities(generator, args.presets)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return False
+    rarities = args.rarities or known
+    unknown = [rarity for rarity in rarities + [rarity for rarity, _ in args.size_budget or []
+                                                if rarity is not None] if rarity not in known]
+    if unknown:
+        print(f"❌ No {generator} preset for {', '.join(unknown)} (have: {', '.join(known)})")
+        return False
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.presets:
+        options.setdefault('presets', args.presets)
+    options.setdefault('segments', args.segments)
+    for name in ('crf', 'preset'):
+        if getattr(args, name) is not None:
+            options.setdefault(name, getattr(args, name))
+    if args.ladder:
+        options.setdefault('ladder', args.ladder)
+    if args.trajectories:
+        options.setdefault('trajectories', True)
+    if args.poster_at is not None:
+        options.setdefault('poster_at', args.poster_at)
+    if args.vfr_threshold is not None:
+        options.setdefault('vfr_threshold', args.vfr_threshold)
+    if args.audio:
+        options.setdefault('audio', {'codec': args.audio, 'preroll': args.audio_preroll})
+    if not args.no_cache:
+        options.setdefault('cache_dir', args.cache_dir or os.path.join(args.output_dir, ".render_cache"))
+    seeds = variant_seeds(args)
+    jobs = build_jobs(render, args.output_dir, rarities, args.resolutions, seeds,
+                      args.codecs, threads=args.threads, **options)
+    if variants is not None and not args.ladder:
+        attach_variants(jobs, functools.partial(variants, presets=args.presets))
+    if args.size_budget:
+        budgets = dict(args.size_budget)
+        for job in jobs:
+            max_bytes = budgets.get(job['rarity'], budgets.get(None))
+            if max_bytes is not None:
+                job['kwargs'].setdefault('tune', {
+                    'max_bytes': max_bytes, 'min_ssim': args.min_ssim, 'presets': args.tune_presets,
+                    'codecs': args.tune_codecs or [job['kwargs']['codec']], 'threads': args.threads,
+                })
+    parity_path = None
+    if getattr(args, 'parity', False):
+        parity_path = args.parity_baseline or os.path.join(args.output_dir, "parity_baseline.json")
+        baseline = {} if args.update_parity_baseline else load_baseline(parity_path)
+        # Only rarities with Flutter painters, drawn with Flutter's seed, have
+        # a reference to score against
+        for job in jobs:
+            if job['rarity'] not in PAINTERS or job['kwargs']['seed'] != FLUTTER_SEED:
+                continue
+            job['kwargs']['parity'] = True
+            job['parity'] = {'baseline': baseline.get(job['name']),
+                             'min_ssim': args.parity_min_ssim, 'min_psnr': args.parity_min_psnr,
+                             'ssim_tolerance': args.parity_tolerance, 'psnr_tolerance': args.parity_psnr_tolerance}
+    workers = args.jobs or default_workers(args.threads)
+    # A farm worker must not fan out to a pool sized for the whole machine
+    budget = job_workers(min(workers, len(jobs)), args.threads)
+    for job in jobs:
+        job['kwargs'].setdefault('workers', budget)
+    manifest_path = args.manifest or os.path.join(args.output_dir, "render_manifest.json")
+    print(f"Rendering {len(jobs)} job(s) on {workers} worker(s)...")
+
+    results = run_jobs(jobs, workers, manifest_path, seeds={rarity: seeds for rarity in rarities})
+    failed = [result for result in results if result['status'] != 'ok']
+    for result in results:
+        marker = "✅" if result['status'] == 'ok' else "❌"
+        status = "" if result['status'] in ('ok', 'failed') else f" [{result['status']}]"
+        print(f"{marker} {result['name']}: {result['wall_time']:.2f}s, {result['output_bytes'] / 1024:.1f} KB{status}")
+    if len(args.codecs) > 1:
+        print_codec_comparison(results)
+    if args.vfr_threshold is not None:
+        print_vfr_savings(results)
+    if args.audio:
+        print_audio_comparison(results)
+    if parity_path:
+        update_parity_baseline(parity_path, jobs, results)
+    timing_path = args.timing_report or os.path.join(args.output_dir, "render_timing.json")
+    report = timing.write_timing_report(timing_path, results)
+    print("Stage totals: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in report['totals'].items()))
+    print(f"Manifest written to: {manifest_path}")
+    print(f"Timing report written to: {timing_path}")
+    return not failed
+
+
+def print_codec_comparison(results):
+    """Summarize size and decode time per codec and pick the cheapest alpha one"""
+    totals = {}
+    for result in results:
+        if result['status'] != 'ok':
+            continue
+        total = totals.setdefault(result['codec'], {'bytes': 0, 'decode_time': 0.0, 'alpha': result['alpha']})
+        total['bytes'] += result['output_bytes']
+        total['decode_time'] += result.get('decode_time', 0.0)
+    print("\nCodec comparison (all jobs):")
+    for codec, total in sorted(totals.items(), key=lambda item: item[1]['bytes']):
+        alpha = "alpha" if total['alpha'] else "opaque"
+        print(f"   {codec:10s} {alpha:7s} {total['bytes'] / 1024:9.1f} KB  decode {total['decode_time'] * 1000:7.1f} ms")
+    alpha_codecs = [(total['bytes'], total['decode_time'], codec) for codec, total in totals.items() if total['alpha']]
+    if alpha_codecs:
+        print(f"   Cheapest format that keeps transparency: {min(alpha_codecs)[2]}")
+
+
+def print_vfr_savings(results):
+    """Summarize the size and decode time VFR output saved per rarity
+
+    Only jobs that were encoded in this run report savings; cache hits
+    carry no constant-rate encode to compare against. Jobs that shipped
+    the constant-rate encode save nothing.
+    """
+    totals = {}
+    for result in results:
+        if 'vfr' not in result:
+            continue
+        vfr = result['vfr']
+        total = totals.setdefault(result['rarity'], dict.fromkeys(
+            ('frames', 'kept', 'cfr_bytes', 'saved_bytes', 'saved_time', 'cfr_shipped'), 0))
+        for key in ('frames', 'kept', 'cfr_bytes'):
+            total[key] += vfr[key]
+        if vfr['shipped'] == 'vfr':
+            total['saved_bytes'] += vfr['cfr_bytes'] - vfr['vfr_bytes']
+            total['saved_time'] += vfr['cfr_decode_time'] - vfr['vfr_decode_time']
+        else:
+            total['cfr_shipped'] += 1
+    if not totals:
+        return
+    print("\nVFR savings (jobs encoded this run):")
+    for rarity, total in totals.items():
+        fallback = f", {total['cfr_shipped']} shipped constant-rate" if total['cfr_shipped'] else ""
+        print(f"   {rarity:10s} kept {total['kept']}/{total['frames']} frames, "
+              f"saved {total['saved_bytes'] / 1024:7.1f} KB "
+              f"({total['saved_bytes'] / max(total['cfr_bytes'], 1):.0%}), "
+              f"decode {total['saved_time'] * 1000:6.1f} ms{fallback}")
+
+
+def print_audio_comparison(results):
+    """Summarize muxed vs separate size and time-to-first-frame per rarity"""
+    # A comparison that failed part-way has no byte counts to show
+    rows = [result for result in results if 'combined_bytes' in result.get('audio', {})]
+    if not rows:
+        return
+    print("\nAudio mux vs separate video + sounds (jobs encoded this run):")
+    for result in rows:
+        audio = result['audio']
+        print(f"   {result['name']:20s} {audio['combined_bytes'] / 1024:7.1f} KB vs {audio['separate_bytes'] / 1024:7.1f} KB  "
+              f"(audio track {audio['audio_bytes'] / 1024:.1f} KB), first frame "
+              f"{audio['muxed_first_frame'] * 1000:5.1f} ms vs {audio['separate_first_frame'] * 1000:5.1f} ms")
+
+
+def update_parity_baseline(path, jobs, results):
+    """Print parity scores and record them for jobs that had no baseline yet
+
+    A failed job never seeds or replaces a baseline, so a render below
+    the absolute marks never becomes the reference, and a regression
+    keeps failing until it is fixed or the baseline is updated on purpose.
+    """
+    baseline = load_baseline(path)
+    print("\nParity with the Flutter painters (worst frame):")
+    for job, result in zip(jobs, results):
+        report = result.get('parity')
+        if not report:
+            continue
+        marker = "✅" if report['passed'] else "❌"
+        print(f"   {marker} {result['name']:20s} SSIM {report['min_ssim']:.4f} (mean {report['mean_ssim']:.4f})  "
+              f"PSNR {report['min_psnr']:5.1f} dB (mean {report['mean_psnr']:.1f} dB)")
+        if job['parity']['baseline'] is None and result['status'] == 'ok' and report['passed']:
+            baseline[result['name']] = parity_summary(report)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    print(f"Parity baseline: {path}")
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+FFmpeg helpers for SwapDotz celebration videos
+Pipes raw frames from the NumPy renderer into ffmpeg, either as one encoder
+process or as GOP-aligned segments encoded in parallel and joined losslessly
+"""
+
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import celebration_timing as timing
+from celebration_cache import ffmpeg_version
+from celebration_frames import render_frames, tap_frames
+
+# Output codecs selectable per render job. Alpha profiles take straight
+# RGBA from the renderer so the overlay can be composited over the app UI.
+CODECS = {
+    'h264': {
+        'ext': '.mp4', 'alpha': False, 'segmentable': True,
+        'args': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p'],
+    },
+    'hevc': {
+        'ext': '.mp4', 'alpha': False, 'segmentable': True,
+        'args': ['-c:v', 'libx265', '-pix_fmt', 'yuv420p', '-tag:v', 'hvc1',
+                 '-x265-params', 'log-level=error'],
+    },
+    'vp9_alpha': {
+        'ext': '.webm', 'alpha': True, 'segmentable': True,
+        'args': ['-c:v', 'libvpx-vp9', '-pix_fmt', 'yuva420p', '-b:v', '0', '-auto-alt-ref', '0'],
+        # FFmpeg's native VP9 decoder drops the alpha plane
+        'decoder': ['-c:v', 'libvpx-vp9'],
+    },
+    'webp': {
+        'ext': '.webp', 'alpha': True, 'segmentable': False,
+        'args': ['-c:v', 'libwebp_anim', '-pix_fmt', 'yuva420p', '-loop', '0'],
+        # FFmpeg cannot decode animated WebP; time Pillow instead
+        'decoder': 'pillow',
+    },
+    'apng': {
+        'ext': '.png', 'alpha': True, 'segmentable': False,
+        'args': ['-c:v', 'apng', '-pix_fmt', 'rgba', '-plays', '0', '-f', 'apng'],
+    },
+}
+
+# x264 preset names mapped onto each encoder's speed knob
+PRESETS = {
+    'ultrafast': 0, 'superfast': 1, 'veryfast': 2, 'faster': 3, 'fast': 4,
+    'medium': 5, 'slow': 6, 'slower': 7, 'veryslow': 8,
+}
+
+
+def encoder_args(codec='h264', crf=18, preset='fast', threads=None):
+    """Build the ffmpeg output flags for a codec
+
+    crf and preset use x264's scales and are mapped onto the other
+    encoders. The defaults are the flags used for the shipped celebration
+    MP4s.
+    """
+    profile = CODECS[codec]
+    args = list(profile['args'])
+    speed = PRESETS[preset]
+    if codec in ('h264', 'hevc'):
+        args += ['-crf', str(crf), '-preset', preset]
+    elif codec == 'vp9_alpha':
+        args += ['-crf', str(round(crf * 63 / 51)), '-deadline', 'good', '-cpu-used', str(max(0, 8 - speed))]
+    elif codec == 'webp':
+        args += ['-quality', str(round(100 * (1 - crf / 51))), '-compression_level', str(min(6, speed * 6 // 8))]
+    if threads:
+        args += ['-threads', str(threads)]
+        if codec == 'vp9_alpha':
+            args += ['-row-mt', '1']
+    if profile['ext'] == '.mp4':
+        args += ['-movflags', '+faststart']
+    return args
+
+
+def input_pix_fmt(codec):
+    """Raw pixel format the renderer should pipe for a codec"""
+    return 'rgba' if CODECS[codec]['alpha'] else 'rgb24'
+
+
+def _older_than(release):
+    """True when the installed ffmpeg predates release, e.g. (5, 1)
+
+    Version strings without a release number (git builds) are taken as new.
+    """
+    match = re.search(r'version n?(\d+)\.(\d+)', ffmpeg_version())
+    return bool(match) and (int(match.group(1)), int(match.group(2))) < release
+
+
+def fps_mode_args(mode):
+    """Frame-rate mode flags: -fps_mode from ffmpeg 5.1, -vsync before it
+
+    Stock Ubuntu 22.04 ships ffmpeg 4.4, which has no -fps_mode.
+    """
+    if _older_than((5, 1)):
+        return ['-vsync', mode]
+    return ['-fps_mode', mode]
+
+
+def progress_args():
+    """Flags streaming progress to stdout every 0.5 s
+
+    -stats_period arrived in ffmpeg 4.4 and older builds reject it; they
+    report at their fixed 0.5 s period without it.
+    """
+    args = ['-progress', 'pipe:1', '-nostats']
+    if not _older_than((4, 4)):
+        args += ['-stats_period', '0.5']
+    return args
+
+
+def decode_time(path, codec='h264', timeout=60):
+    """Wall time in seconds to decode every frame of an encoded output"""
+    decoder = CODECS[codec].get('decoder', [])
+    started = time.perf_counter()
+    if decoder == 'pillow':
+        from PIL import Image, ImageSequence
+        with Image.open(path) as image:
+            for frame in ImageSequence.Iterator(image):
+                frame.load()
+    else:
+        cmd = ['ffmpeg', '-loglevel', 'error', *decoder, '-i', path, '-f', 'null', '-']
+        subprocess.run(cmd, capture_output=True, timeout=timeout, check=True)
+    return time.perf_counter() - started
+
+
+def _raw_input_args(width, height, fps, pix_fmt):
+    """ffmpeg input flags for raw frames piped on stdin"""
+    return [
+        '-f', 'rawvideo',
+        '-pix_fmt', pix_fmt,
+        '-s', f'{width}x{height}',
+        '-r', str(fps),
+        '-i', '-',
+    ]
+
+
+class _Progress:
+    """Parses `-progress pipe:1` output and watches it for stalls"""
+
+    def __init__(self, label):
+        self.label = label
+        self.fields = {}
+        self.last = {}
+        self.stalled = False
+        self.done = threading.Event()
+        self.live = sys.stdout.isatty()
+        self.touch()
+
+    def touch(self):
+        self.updated = time.monotonic()
+
+    def read(self, stream):
+        for line in stream:
+            key, _, value = line.decode(errors='replace').strip().partition('=')
+            self.fields[key] = value
+            if key == 'progress':
+                # ffmpeg reports on a timer even when idle; only advancing counts
+                if value == 'end' or any(self.fields.get(name) != self.last.get(name)
+                                         for name in ('frame', 'out_time_us', 'total_size')):
+                    self.touch()
+                self.last = dict(self.fields)
+                if self.live:
+                    print(f"\r   {self.label}: {self.summary()}", end='', flush=True)
+
+    def watch(self, proc, stall_timeout):
+        while not self.done.wait(min(1.0, stall_timeout)):
+            if time.monotonic() - self.updated > stall_timeout:
+                self.stalled = True
+                proc.kill()
+                return
+
+    def summary(self):
+        last = self.last
+        return (f"frame={last.get('frame', '0'):>5} fps={last.get('fps', '0'):>6} "
+                f"speed={last.get('speed', 'N/A').strip():>7} bitrate={last.get('bitrate', 'N/A').strip()}")
+
+    def report(self):
+        """Final progress fields worth keeping in the timing report"""
+        last = self.last
+        fields = {'frames': int(last.get('frame', 0) or 0), 'speed': last.get('speed', 'N/A').strip(),
+                  'bitrate': last.get('bitrate', 'N/A').strip()}
+        try:
+            fields['fps'] = float(last.get('fps', 0))
+        except ValueError:
+            pass
+        return fields
+
+
+def run_ffmpeg(cmd, frames=None, timeout=60, stage='encode'):
+    """Run an ffmpeg command, optionally feeding raw frames on stdin
+
+    Progress is streamed from `-progress pipe:1` and shown live on a
+    terminal. timeout is a stall watchdog: the process is killed only after
+    that many seconds with neither progress output nor a frame accepted,
+    and subprocess.TimeoutExpired is raised as before. The run is recorded
+    as a timing stage. Returns a CompletedProcess like subprocess.run so
+    callers can check returncode and stderr the same way.
+    """
+    cmd = [cmd[0], *progress_args(), *cmd[1:]]
+    progress = _Progress(stage)
+    with timing.stage(stage) as record, tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if frames is not None else subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=stderr)
+        reader = threading.Thread(target=progress.read, args=(proc.stdout,), daemon=True)
+        watchdog = threading.Thread(target=progress.watch, args=(proc, timeout), daemon=True)
+        reader.start()
+        watchdog.start()
+        try:
+            if frames is not None:
+                try:
+                    for frame in frames:
+                        proc.stdin.write(memoryview(frame))
+                        progress.touch()
+                except BrokenPipeError:
+                    pass  # ffmpeg exited early; its stderr explains why
+                finally:
+                    proc.stdin.close()
+            returncode = proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            progress.done.set()
+            reader.join()
+            if progress.live:
+                print()
+            elif progress.last:
+                print(f"   {stage}: {progress.summary()}")
+        record.update(progress.report())
+        if progress.stalled:
+            record['stalled'] = True
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        stderr.seek(0)
+        return subprocess.CompletedProcess(cmd, returncode, None, stderr.read().decode(errors='replace'))
+
+
+def encode_frames(frames, width, height, fps, output_path, output_args=None,
+                  pix_fmt='rgb24', timeout=60, stage='encode'):
+    """Encode an iterable of raw frames through ffmpeg's stdin"""
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        *_raw_input_args(width, height, fps, pix_fmt),
+        *(output_args or encoder_args()),
+        output_path,
+    ]
+    return run_ffmpeg(cmd, frames, timeout, stage)
+
+
+def _without_faststart(args):
+    """Drop -movflags +faststart; only the final joined file needs it"""
+    result = []
+    skip = False
+    for index, arg in enumerate(args):
+        if skip:
+            skip = False
+            continue
+        if arg == '-movflags' and index + 1 < len(args) and args[index + 1] == '+faststart':
+            skip = True
+            continue
+        result.append(arg)
+    return result
+
+
+def segment_ranges(frame_count, segments, gop):
+    """Split frame_count into at most `segments` ranges on GOP boundaries"""
+    gops = math.ceil(frame_count / gop)
+    gops_per_segment = math.ceil(gops / max(1, segments))
+    step = gops_per_segment * gop
+    return [(start, min(start + step, frame_count)) for start in range(0, frame_count, step)]
+
+
+def _encode_segment(renderer, start, stop, width, height, fps, path, output_args, pix_fmt, timeout):
+    """Worker entry point: render and encode frames [start, stop) to path"""
+    # Named apart from the caller's 'encode' stage, which already spans this run
+    result = encode_frames(render_frames(renderer, stop, start=start, pix_fmt=pix_fmt), width, height,
+                           fps, path, output_args=output_args, pix_fmt=pix_fmt, timeout=timeout,
+                           stage='encode_segment')
+    return result.returncode, result.stderr
+
+
+def encode_segments(renderer, frame_count, width, height, fps, output_path, output_args=None,
+                    segments=2, gop=None, workers=None, pix_fmt='rgb24', timeout=60):
+    """Render and encode GOP-aligned time slices in parallel, then join them
+
+    Each slice starts on a keyframe and uses the same encoder flags, so the
+    concat demuxer can stream-copy them into one file with continuous
+    timestamps and +faststart. workers caps the slices encoding at once;
+    with one worker they run in this process. Returns a CompletedProcess
+    for the join.
+    """
+    output_args = list(output_args or encoder_args())
+    gop = gop or int(round(fps))
+    ranges = segment_ranges(frame_count, segments, gop)
+    # Pin the keyframe cadence so every slice boundary is a GOP boundary
+    segment_args = _without_faststart(output_args) + ['-g', str(gop)]
+    ext = os.path.splitext(output_path)[1]
+    work_dir = tempfile.mkdtemp(prefix="celebration_segments_")
+    try:
+        paths = [os.path.join(work_dir, f"segment{index:03d}{ext}") for index in range(len(ranges))]
+        workers = min(len(ranges), workers or os.cpu_count() or 1)
+        jobs = [(renderer, start, stop, width, height, fps, path, segment_args, pix_fmt, timeout)
+                for (start, stop), path in zip(ranges, paths)]
+        with timing.stage('encode', segments=len(ranges), workers=workers):
+            if workers <= 1:
+                results = (_encode_segment(*job) for job in jobs)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(_encode_segment, *zip(*jobs)))
+            for returncode, stderr in results:
+                if returncode != 0:
+                    return subprocess.CompletedProcess([], returncode, None, stderr)
+
+        list_path = os.path.join(work_dir, "segments.txt")
+        with open(list_path, 'w') as f:
+            f.writelines(f"file '{path}'\n" for path in paths)
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            output_path,
+        ]
+        return run_ffmpeg(cmd, timeout=timeout, stage='mux')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def encode_renderer(renderer, frame_count, width, height, fps, output_path, codec='h264',
+                    output_args=None, segments=1, timeout=60, frame_cache=None, vfr_threshold=None,
+                    tune=None, workers=None, observe=None):
+    """Encode a renderer's clip in one pass, or in parallel time slices
+
+    Alpha codecs receive straight RGBA frames. Codecs whose containers
+    cannot be stream-copied by the concat demuxer always use one pass.
+    With a frame_cache directory, single-pass encodes of small clips keep
+    their frames for re-encodes (see encode_cached). A
+    vfr_threshold drops near-duplicate frames into a variable-rate output
+    (always one pass). tune holds tune_encoder targets (max_bytes,
+    min_ssim, ...) and replaces output_args with the tuned configuration.
+    workers caps the processes a parallel encode or tuning search may start
+    (default: one per core), so a render farm job can stay within its share.
+    observe, if given, is handed every frame the encode read, in order, as
+    the frames go by; parallel slices render in other processes and are
+    not observed.
+    """
+    output_args = output_args or encoder_args(codec)
+    pix_fmt = input_pix_fmt(codec)
+    if tune:
+        from celebration_tuner import tune_encoder
+        tune = dict(tune)
+        tune.setdefault('codecs', (codec,))
+        tune.setdefault('workers', workers)
+        return tune_encoder(renderer, frame_count, fps, output_path, frame_cache=frame_cache, timeout=timeout,
+                            observe=observe, **tune)
+    if vfr_threshold is not None:
+        from celebration_vfr import encode_vfr
+        return encode_vfr(renderer, frame_count, fps, output_path, output_args, codec=codec, pix_fmt=pix_fmt,
+                          threshold=vfr_threshold, frame_cache=frame_cache, timeout=timeout, observe=observe)
+    if frame_cache and segments <= 1:
+        # Imported here: the intermediate cache builds on this module
+        from celebration_intermediate import encode_cached
+        return encode_cached(renderer, frame_count, fps, frame_cache, output_path, output_args, pix_fmt=pix_fmt,
+                             timeout=timeout, observe=observe)
+    if segments > 1 and CODECS[codec]['segmentable']:
+        return encode_segments(renderer, frame_count, width, height, fps, output_path, output_args,
+                               segments=segments, workers=workers, pix_fmt=pix_fmt, timeout=timeout)
+    return encode_frames(tap_frames(render_frames(renderer, frame_count, pix_fmt=pix_fmt), observe), width, height,
+                         fps, output_path, output_args=output_args, pix_fmt=pix_fmt, timeout=timeout)
+
+
+def parse_tier(value):
+    """Parse a ladder tier 'WIDTHxHEIGHT@FPS[:LOD]' into a dict"""
+    size, _, rest = value.partition('@')
+    fps, _, lod = rest.partition(':')
+    width, height = size.lower().split('x')
+    return {'width': int(width), 'height': int(height), 'fps': int(fps or 30), 'lod': float(lod or 1.0)}
+
+
+def ladder_output_path(output_path, tier):
+    """Output path for one ladder tier, e.g. rare_celebration_360x640_24fps.mp4"""
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}_{tier['width']}x{tier['height']}_{tier['fps']}fps{ext}"
+
+
+def encode_ladder(renderer, frame_count, fps, tiers, output_path, codec='h264', output_args=None,
+                  timeout=60):
+    """Encode a resolution/fps ladder from one render pass
+
+    The renderer draws each distinct particle level of detail once per
+    frame; the LOD variants are stacked into one raw frame, and a single
+    ffmpeg process crops, splits, scales and resamples them into every
+    tier. Returns a CompletedProcess for that process.
+    """
+    output_args = output_args or encoder_args(codec)
+    pix_fmt = input_pix_fmt(codec)
+    width, height = renderer.width, renderer.height
+    lods = sorted({tier['lod'] for tier in tiers}, reverse=True)
+    convert = renderer.to_rgba if pix_fmt == 'rgba' else renderer.to_rgb24
+    stacked = np.empty((height * len(lods), width, 4 if pix_fmt == 'rgba' else 3), dtype=np.uint8)
+
+    def frames():
+        for index in range(frame_count):
+            for slot, lod in enumerate(lods):
+                renderer.render(index, lod=lod)
+                stacked[slot * height:(slot + 1) * height] = convert()
+            yield stacked
+
+    filters = [f"[0:v]split={len(lods)}" + "".join(f"[lod{slot}]" for slot in range(len(lods)))]
+    outputs = []
+    for slot, lod in enumerate(lods):
+        members = [index for index, tier in enumerate(tiers) if tier['lod'] == lod]
+        labels = "".join(f"[s{index}]" for index in members)
+        filters.append(f"[lod{slot}]crop={width}:{height}:0:{slot * height},split={len(members)}{labels}")
+        for index in members:
+            tier = tiers[index]
+            filters.append(f"[s{index}]scale={tier['width']}:{tier['height']}:flags=area,fps={tier['fps']}[t{index}]")
+            outputs += ['-map', f'[t{index}]', *output_args, ladder_output_path(output_path, tier)]
+
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        *_raw_input_args(width, height * len(lods), fps, pix_fmt),
+        '-filter_complex', ";".join(filters),
+        *outputs,
+    ]
+    return run_ffmpeg(cmd, frames(), timeout)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+NumPy frame renderer for SwapDotz celebration videos
+Looks up every particle position for a frame from keyframe tables and
+rasterizes the whole frame at once into a reusable RGBA buffer
+"""
+
+import functools
+
+import numpy as np
+
+# Particle stamps: diameters from STAMP_MIN_SIZE up in STAMP_STEP buckets,
+# each pre-shifted to STAMP_PHASES x STAMP_PHASES sub-pixel offsets
+STAMP_MIN_SIZE = 2.0
+STAMP_MAX_SIZE = 20.0
+STAMP_STEP = 0.25
+STAMP_PHASES = 4
+
+# Side of the square tiles used to track which parts of a frame changed
+TILE_SIZE = 32
+
+
+def hex_to_rgb(color):
+    """Convert '#RRGGBB' into a float RGB triple in 0..1"""
+    value = color.lstrip('#')
+    return np.array([int(value[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.float32) / 255.0
+
+
+def color_lerp(color_a, color_b, t):
+    """Flutter's Color.lerp for an array of t values, returned as '#RRGGBB'
+
+    Channels are interpolated as doubles and truncated to ints like Dart's
+    lerpDouble(...).toInt().
+    """
+    a = hex_to_rgb(color_a).astype(np.float64) * 255.0
+    b = hex_to_rgb(color_b).astype(np.float64) * 255.0
+    t = np.asarray(t, dtype=np.float64)[..., None]
+    channels = np.clip(np.trunc(np.round(a) + (np.round(b) - np.round(a)) * t), 0, 255).astype(np.int64)
+    return [f"#{r:02X}{g:02X}{b:02X}" for r, g, b in channels.reshape(-1, 3)]
+
+
+def _square_offsets(max_size):
+    """Pixel offsets covering a max_size x max_size square, row-major"""
+    dy, dx = np.divmod(np.arange(max_size * max_size), max_size)
+    return dx.astype(np.int32), dy.astype(np.int32)
+
+
+@functools.lru_cache(maxsize=None)
+def circle_stamps(max_size=STAMP_MAX_SIZE):
+    """Anti-aliased circle coverage stamps for every size bucket and phase
+
+    Returns (bucket diameters (B,), stamps (B, P, P, K, K)), where stamp
+    [b, py, px] is a circle of diameter b whose center sits (px + 0.5) / P
+    and (py + 0.5) / P pixels right of and below pixel (K // 2, K // 2).
+    Coverage ramps over one pixel at the rim like Skia's AA circles.
+    """
+    diameters = np.arange(STAMP_MIN_SIZE, max_size + STAMP_STEP / 2, STAMP_STEP, dtype=np.float32)
+    kernel = int(np.ceil(max_size)) + 3
+    phases = (np.arange(STAMP_PHASES, dtype=np.float32) + 0.5) / STAMP_PHASES
+    pixel = np.arange(kernel, dtype=np.float32) + 0.5 - kernel // 2
+    dy = pixel[None, :, None] - phases[:, None, None]   # (P, K, 1)
+    dx = pixel[None, None, :] - phases[:, None, None]   # (P, 1, K)
+    distance = np.hypot(dx[None, :, :, :], dy[:, None, :, :])  # (Py, Px, K, K)
+    radius = diameters[:, None, None, None, None] / 2
+    stamps = np.clip(radius + 0.5 - distance[None], 0.0, 1.0)
+    stamps.setflags(write=False)
+    return diameters, stamps
+
+
+class FrameRenderer:
+    """Rasterizes particle, ray and ring layers into one premultiplied RGBA buffer
+
+    Layers are driven by precomputed keyframe tables (see
+    celebration_keyframes), so rendering a frame is a row lookup plus one
+    batched blend per layer. Only tiles that were drawn on are cleared and
+    converted again, so a mostly empty frame costs its covered area.
+    """
+
+    def __init__(self, width, height, bg_color=None):
+        self.width = width
+        self.height = height
+        self._allocate_buffers()
+        # Premultiplied background; None keeps the black@0.0 transparent base
+        self.background = np.zeros(4, dtype=np.float32)
+        if bg_color is not None:
+            self.background[:3] = hex_to_rgb(bg_color)
+            self.background[3] = 1.0
+        self.layers = []
+
+    def __getstate__(self):
+        # Frame buffers are scratch space; workers reallocate them
+        state = self.__dict__.copy()
+        for name in ('frame', '_rgb', '_rgb8', '_rgba', '_rgba8', '_distance_grids',
+                     '_drawn', '_dirty', '_stale_rgb', '_stale_rgba'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._allocate_buffers()
+
+    def _allocate_buffers(self):
+        self.frame = np.zeros((self.height, self.width, 4), dtype=np.float32)
+        self._rgb = np.empty((self.height, self.width, 3), dtype=np.float32)
+        self._rgb8 = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self._rgba = np.empty((self.height, self.width, 4), dtype=np.float32)
+        self._rgba8 = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        # Sorted distance fields keyed by ring center, built on first use
+        self._distance_grids = {}
+        # Tile masks: drawn on this frame, needing a background reset, and
+        # not yet converted into each packed output buffer
+        tiles = (-(-self.height // TILE_SIZE), -(-self.width // TILE_SIZE))
+        self._drawn = np.zeros(tiles, dtype=bool)
+        self._dirty = np.ones(tiles, dtype=bool)
+        self._stale_rgb = np.ones(tiles, dtype=bool)
+        self._stale_rgba = np.ones(tiles, dtype=bool)
+
+    def add_particles(self, track, sizes, colors):
+        """Add round particles following a particle_track keyframe table
+
+        Positions are circle centers and sizes are diameters, like
+        Canvas.drawCircle with radius size / 2.
+        """
+        sizes = np.asarray(sizes, dtype=np.float32)
+        largest = float(sizes.max() * track['scale'].max()) if sizes.size else 0.0
+        # Stamps cover 2-20px; larger presets extend the buckets to fit
+        max_size = max(STAMP_MAX_SIZE, float(np.ceil(largest)))
+        diameters, stamps = circle_stamps(max_size)
+        self.layers.append({
+            'kind': 'particles',
+            'track': track,
+            'sizes': sizes,
+            'colors': np.asarray(colors, dtype=np.float32).reshape(-1, 3),
+            'max_size': max_size,
+            'offsets': _square_offsets(stamps.shape[-1]),
+        })
+
+    def add_rays(self, center_x, center_y, ray_count, track, color, width=2):
+        """Add burst rays growing from the center like Flutter's _BurstPainter
+
+        Each ray is an anti-aliased line of the given stroke width with
+        round caps. The pixels around every ray at its longest are found
+        once, in the ray's own along/across coordinates, so a frame only
+        measures their distance to the current segment.
+        """
+        angles = (2 * np.pi / ray_count) * np.arange(ray_count)
+        dx, dy = np.cos(angles), np.sin(angles)
+        half = width / 2
+        reach = float(track['length'].max()) + half + 1
+        span = np.arange(-int(np.ceil(reach)) - 1, int(np.ceil(reach)) + 2)
+        xs = (np.floor(center_x) + span)[None, :].repeat(len(span), axis=0).ravel()
+        ys = (np.floor(center_y) + span)[:, None].repeat(len(span), axis=1).ravel()
+        offset_x, offset_y = xs + 0.5 - center_x, ys + 0.5 - center_y
+        along = dx[:, None] * offset_x + dy[:, None] * offset_y
+        across = dx[:, None] * offset_y - dy[:, None] * offset_x
+        near = (np.abs(across) <= half + 1) & (along >= -half - 1) & (along <= reach)
+        # Pad every ray to the same pixel count; padding sits out of reach
+        size = int(near.sum(axis=1).max())
+        keep = np.argsort(~near, axis=1, kind='stable')[:, :size]
+        padding = ~np.take_along_axis(near, keep, axis=1)
+        across = np.take_along_axis(across, keep, axis=1)
+        across[padding] = np.inf
+        self.layers.append({
+            'kind': 'rays',
+            'track': track,
+            'xs': xs[keep].astype(np.int32),
+            'ys': ys[keep].astype(np.int32),
+            'along': np.take_along_axis(along, keep, axis=1).astype(np.float32),
+            'across': across.astype(np.float32),
+            'half_width': np.float32(half),
+            'colors': np.broadcast_to(hex_to_rgb(color), (ray_count, 3)),
+        })
+
+    def add_ring(self, center_x, center_y, track, color):
+        """Add an anti-aliased stroked circle like Flutter's _ShockwavePainter"""
+        self.layers.append({
+            'kind': 'ring',
+            'track': track,
+            'center': (float(center_x), float(center_y)),
+            'color': hex_to_rgb(color),
+        })
+
+    def render(self, index, lod=1.0):
+        """Render frame number index and return the RGBA buffer
+
+        lod < 1 draws only that share of each particle layer; particles
+        come from random draws, so any prefix is an unbiased subset.
+        """
+        # Reset only the tiles the previous frame drew on
+        for rows, cols in self._tile_spans(self._dirty):
+            self.frame[rows, cols] = self.background
+        self._drawn[...] = False
+        for layer in self.layers:
+            # Tables shorter than the clip hold their last keyframe
+            row = min(index, len(layer['track']['alpha']) - 1)
+            if layer['kind'] == 'particles':
+                self._draw_particles(layer, row, lod)
+            elif layer['kind'] == 'rays':
+                self._draw_rays(layer, row)
+            else:
+                self._draw_ring(layer, row)
+        changed = self._dirty | self._drawn
+        self._stale_rgb |= changed
+        self._stale_rgba |= changed
+        self._dirty = self._drawn.copy()
+        return self.frame
+
+    def _tile_spans(self, mask):
+        """(rows, cols) slices covering the marked tiles, one span per tile row"""
+        for tile_row in np.flatnonzero(mask.any(axis=1)):
+            tile_cols = np.flatnonzero(mask[tile_row])
+            yield (slice(tile_row * TILE_SIZE, min((tile_row + 1) * TILE_SIZE, self.height)),
+                   slice(tile_cols[0] * TILE_SIZE, min((tile_cols[-1] + 1) * TILE_SIZE, self.width)))
+
+    def _mark(self, pixel):
+        """Mark the tiles holding the given flat pixel indices as drawn"""
+        tile = (pixel // self.width // TILE_SIZE) * self._drawn.shape[1] + (pixel % self.width) // TILE_SIZE
+        self._drawn.reshape(-1)[tile] = True
+
+    def _draw_particles(self, layer, row, lod=1.0):
+        track = layer['track']
+        alpha = float(track['alpha'][row])
+        if alpha <= 0.0:
+            return
+        count = int(np.ceil(len(layer['sizes']) * lod))
+        centers = track['positions'][row, :count]
+        sizes = layer['sizes'][:count] * track['scale'][row]
+        diameters, stamps = circle_stamps(layer['max_size'])
+        kernel = stamps.shape[-1]
+        buckets = np.clip(np.rint((sizes - STAMP_MIN_SIZE) / STAMP_STEP), 0, len(diameters) - 1).astype(np.intp)
+        # Split each center into the pixel holding it and a sub-pixel phase
+        base = np.floor(centers)
+        phase = np.minimum(((centers - base) * STAMP_PHASES).astype(np.intp), STAMP_PHASES - 1)
+        coverage = stamps[buckets, phase[:, 1], phase[:, 0]].reshape(count, -1) * alpha
+        # Particles below the smallest bucket keep their true area
+        coverage *= (np.minimum(sizes / STAMP_MIN_SIZE, 1.0) ** 2)[:, None]
+        dx, dy = layer['offsets']
+        xs = base[:, 0].astype(np.int32)[:, None] - kernel // 2 + dx[None, :]
+        ys = base[:, 1].astype(np.int32)[:, None] - kernel // 2 + dy[None, :]
+        self._splat(xs, ys, layer['colors'][:count], coverage)
+
+    def _draw_rays(self, layer, row):
+        track = layer['track']
+        alpha = float(track['alpha'][row])
+        if alpha <= 0.0:
+            return
+        # Distance to the segment from the center to the current length
+        along = layer['along']
+        distance = np.hypot(along - np.clip(along, 0.0, track['length'][row]), layer['across'])
+        coverage = np.clip(layer['half_width'] + 0.5 - distance, 0.0, 1.0) * alpha
+        self._splat(layer['xs'], layer['ys'], layer['colors'], coverage)
+
+    def _distance_grid(self, center):
+        """Pixel-center distances to center, sorted, with their flat pixel indices
+
+        Built once per center; each frame then finds its annulus with two
+        binary searches instead of scanning the whole frame.
+        """
+        grid = self._distance_grids.get(center)
+        if grid is None:
+            ys = np.arange(self.height, dtype=np.float32)[:, None] + 0.5 - center[1]
+            xs = np.arange(self.width, dtype=np.float32)[None, :] + 0.5 - center[0]
+            distance = np.hypot(xs, ys).ravel()
+            order = np.argsort(distance, kind='stable')
+            grid = self._distance_grids[center] = (distance[order], order)
+        return grid
+
+    def _draw_ring(self, layer, row):
+        track = layer['track']
+        alpha = float(track['alpha'][row])
+        half = float(track['stroke'][row]) / 2
+        if alpha <= 0.0 or half <= 0.0:
+            return
+        radius = float(track['radius'][row])
+        distances, order = self._distance_grid(layer['center'])
+        lo, hi = np.searchsorted(distances, [radius - half - 0.5, radius + half + 0.5])
+        if lo >= hi:
+            return
+        distance = distances[lo:hi]
+        # Exact 1D box-filter overlap of each pixel with the stroke band
+        coverage = np.minimum(distance + 0.5, radius + half) - np.maximum(distance - 0.5, radius - half)
+        np.clip(coverage, 0.0, 1.0, out=coverage)
+        coverage *= alpha
+        pixels = self.frame.reshape(-1, 4)
+        indices = order[lo:hi]
+        self._mark(indices)
+        src = np.empty((coverage.size, 4), dtype=np.float32)
+        src[:, :3] = coverage[:, None] * layer['color']
+        src[:, 3] = coverage
+        pixels[indices] = src + pixels[indices] * (1.0 - coverage)[:, None]
+
+    def _splat(self, xs, ys, colors, coverage):
+        """Source-over blend per-pixel coverage stamps in painter order
+
+        xs, ys and coverage are (N, M) for N particles; colors is (N, 3).
+        Samples that land on the same pixel are ranked by draw order and
+        blended in that many vectorized passes, so overlaps composite
+        exactly like sequential drawCircle calls.
+        """
+        mask = (coverage > 0) & (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        particle = np.broadcast_to(np.arange(xs.shape[0])[:, None], xs.shape)[mask]
+        pixel = (ys[mask] * self.width + xs[mask]).astype(np.intp)
+        coverage = coverage[mask].astype(np.float32)
+        if not pixel.size:
+            return
+        # Samples are already in draw order; a stable sort groups each pixel
+        order = np.argsort(pixel, kind='stable')
+        pixel, particle, coverage = pixel[order], particle[order], coverage[order]
+        starts = np.flatnonzero(np.r_[True, pixel[1:] != pixel[:-1]])
+        rank = np.arange(pixel.size) - np.repeat(starts, np.diff(np.r_[starts, pixel.size]))
+        self._mark(pixel)
+        frame = self.frame.reshape(-1, 4)
+        by_rank = np.argsort(rank, kind='stable')
+        bounds = np.r_[0, np.cumsum(np.bincount(rank))]
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            chosen = by_rank[lo:hi]
+            target, cov = pixel[chosen], coverage[chosen][:, None]
+            src = np.empty((chosen.size, 4), dtype=np.float32)
+            src[:, :3] = colors[particle[chosen]] * cov
+            src[:, 3:] = cov
+            frame[target] = src + frame[target] * (1.0 - cov)
+
+    def to_rgb24(self):
+        """Flatten the premultiplied buffer over black into packed rgb24 bytes
+
+        Tiles unchanged since the last call keep their packed bytes.
+        """
+        for rows, cols in self._tile_spans(self._stale_rgb):
+            rgb = self._rgb[rows, cols]
+            np.multiply(self.frame[rows, cols, :3], 255.0, out=rgb)
+            np.add(rgb, 0.5, out=rgb)
+            np.copyto(self._rgb8[rows, cols], rgb, casting='unsafe')
+        self._stale_rgb[...] = False
+        return self._rgb8
+
+    def to_rgba(self):
+        """Un-premultiply the buffer into packed straight-alpha rgba bytes
+
+        Tiles unchanged since the last call keep their packed bytes.
+        """
+        for rows, cols in self._tile_spans(self._stale_rgba):
+            frame, rgba = self.frame[rows, cols], self._rgba[rows, cols]
+            alpha = frame[..., 3:]
+            np.divide(frame[..., :3], alpha, out=rgba[..., :3], where=alpha > 0)
+            rgba[..., :3][alpha[..., 0] <= 0] = 0.0
+            rgba[..., 3:] = alpha
+            np.multiply(rgba, 255.0, out=rgba)
+            np.add(rgba, 0.5, out=rgba)
+            np.copyto(self._rgba8[rows, cols], rgba, casting='unsafe')
+        self._stale_rgba[...] = False
+        return self._rgba8
+
+
+def render_frames(renderer, frame_count, start=0, pix_fmt='rgb24'):
+    """Yield packed rgb24 or rgba frames start..frame_count-1, reusing one buffer"""
+    convert = renderer.to_rgba if pix_fmt == 'rgba' else renderer.to_rgb24
+    for index in range(start, frame_count):
+        renderer.render(index)
+        yield convert()
+
+
+def tap_frames(frames, observe=None):
+    """Yield frames unchanged, handing each to observe first (if given)"""
+    for frame in frames:
+        if observe is not None:
+            observe(frame)
+        yield frame
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Lossless intermediate frame cache for SwapDotz celebration videos
+Rendered frames are stored once, as a memory-mapped .npy stack for small
+presets or an FFV1 MKV for the rest, so encoder experiments (CRF, preset,
+codec) only read the cache instead of running the compositor again; the
+least recently used clips are evicted once the cache outgrows its cap
+"""
+
+import hashlib
+import os
+import pickle
+import subprocess
+
+import numpy as np
+
+import celebration_timing as timing
+from celebration_cache import render_key
+from celebration_ffmpeg import encode_frames, run_ffmpeg
+from celebration_frames import render_frames, tap_frames
+
+# Raw stacks up to this size stay as .npy (a 360x640 RGB clip is ~31 MB);
+# larger clips, like every 720x1280 one, go to FFV1
+MAX_NPY_BYTES = 32 * 1024 * 1024
+
+# Cap on a cache directory's intermediates; older clips are evicted past it
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Lossless FFV1 pixel formats matching the renderer's packed layouts
+_FFV1_PIX_FMT = {'rgb24': 'bgr0', 'rgba': 'bgra'}
+
+
+def frame_key(renderer, frame_count, pix_fmt):
+    """Hash the renderer's layers and the frame layout into a cache key
+
+    The encoder flags are left out on purpose: every encode of the same
+    frames shares one intermediate.
+    """
+    layers = hashlib.sha256(pickle.dumps(renderer, protocol=4)).hexdigest()
+    return render_key(kind='frames', layers=layers, width=renderer.width, height=renderer.height,
+                      frame_count=frame_count, pix_fmt=pix_fmt)
+
+
+def _channels(pix_fmt):
+    return 4 if pix_fmt == 'rgba' else 3
+
+
+def intermediate_path(cache_dir, key, width, height, frame_count, pix_fmt, max_npy_bytes=MAX_NPY_BYTES):
+    """Where the intermediate for key lives: .npy if it fits the budget, else .mkv"""
+    raw_bytes = frame_count * width * height * _channels(pix_fmt)
+    ext = '.npy' if raw_bytes <= max_npy_bytes else '.mkv'
+    return os.path.join(cache_dir, key + ext)
+
+
+def _open_npy(renderer, frame_count, path, pix_fmt):
+    shape = (frame_count, renderer.height, renderer.width, _channels(pix_fmt))
+    return np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape)
+
+
+def _tee(frames, stack):
+    """Copy each frame into stack on its way through"""
+    for index, frame in enumerate(frames):
+        stack[index] = frame
+        yield frame
+
+
+def _write_npy(renderer, frame_count, path, pix_fmt):
+    stack = _open_npy(renderer, frame_count, path, pix_fmt)
+    for _ in _tee(render_frames(renderer, frame_count, pix_fmt=pix_fmt), stack):
+        pass
+    stack.flush()
+    del stack
+
+
+def _write_ffv1(renderer, frame_count, fps, path, pix_fmt, timeout):
+    args = ['-c:v', 'ffv1', '-level', '3', '-g', '1', '-slices', '4', '-pix_fmt', _FFV1_PIX_FMT[pix_fmt]]
+    result = encode_frames(render_frames(renderer, frame_count, pix_fmt=pix_fmt), renderer.width,
+                           renderer.height, fps, path, output_args=args, pix_fmt=pix_fmt, timeout=timeout,
+                           stage='intermediate')
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, stderr=result.stderr)
+
+
+def _temp_path(path):
+    """Per-process name to write an intermediate under before it is complete"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{os.getpid()}.tmp{ext}"
+
+
+def evict_intermediates(cache_dir, max_bytes=MAX_CACHE_BYTES, keep=()):
+    """Delete the least recently used intermediates until the rest fit max_bytes
+
+    Hits refresh a clip's mtime, so mtime order is use order. Paths in keep
+    and in-progress .tmp files are never deleted. Returns the removed paths.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(('.npy', '.mkv')) and '.tmp.' not in entry.name:
+            stat = entry.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    keep = {os.path.abspath(path) for path in keep}
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # another worker evicted it first
+        total -= size
+        removed.append(path)
+    return removed
+
+
+def ensure_intermediate(renderer, frame_count, fps, cache_dir, pix_fmt='rgb24',
+                        max_npy_bytes=MAX_NPY_BYTES, timeout=60, max_cache_bytes=MAX_CACHE_BYTES):
+    """Return the intermediate for the renderer's clip, rendering it on a miss
+
+    A hit is touched so it counts as recently used; a miss evicts older
+    clips once the directory holds more than max_cache_bytes.
+    """
+    key = frame_key(renderer, frame_count, pix_fmt)
+    path = intermediate_path(cache_dir, key, renderer.width, renderer.height, frame_count, pix_fmt,
+                             max_npy_bytes)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = _temp_path(path)
+    try:
+        if path.endswith('.npy'):
+            with timing.stage('intermediate', frames=frame_count):
+                _write_npy(renderer, frame_count, tmp_path, pix_fmt)
+        else:
+            _write_ffv1(renderer, frame_count, fps, tmp_path, pix_fmt, timeout)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    evict_intermediates(cache_dir, max_cache_bytes, keep=[path])
+    return path
+
+
+def encode_cached(renderer, frame_count, fps, cache_dir, output_path, output_args, pix_fmt='rgb24', timeout=60,
+                  max_npy_bytes=MAX_NPY_BYTES, max_cache_bytes=MAX_CACHE_BYTES, observe=None):
+    """Encode the renderer's clip in one pass, keeping small clips for re-encodes
+
+    Clips that fit a .npy stack are encoded from it on a hit; on a miss the
+    rendered frames are copied into the stack on their way to the encoder,
+    so a cold render costs no extra pass. Larger clips are encoded straight
+    from the renderer: writing FFV1 next to the encode nearly doubled a
+    720x1280 cold render, and decoding it again is no faster than
+    re-rendering. The tuner and VFR, which read the frames several times,
+    still build those with ensure_intermediate. observe sees every frame
+    fed to the encoder. Returns a CompletedProcess.
+    """
+    key = frame_key(renderer, frame_count, pix_fmt)
+    path = intermediate_path(cache_dir, key, renderer.width, renderer.height, frame_count, pix_fmt,
+                             max_npy_bytes)
+    if os.path.exists(path):
+        os.utime(path)
+        frames = tap_frames(read_intermediate(path, renderer.width, renderer.height, pix_fmt), observe)
+        return encode_frames(frames, renderer.width, renderer.height, fps, output_path, output_args=output_args,
+                             pix_fmt=pix_fmt, timeout=timeout)
+    frames = tap_frames(render_frames(renderer, frame_count, pix_fmt=pix_fmt), observe)
+    if not path.endswith('.npy'):
+        return encode_frames(frames, renderer.width, renderer.height, fps, output_path,
+                             output_args=output_args, pix_fmt=pix_fmt, timeout=timeout)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = _temp_path(path)
+    try:
+        stack = _open_npy(renderer, frame_count, tmp_path, pix_fmt)
+        result = encode_frames(_tee(frames, stack), renderer.width, renderer.height, fps, output_path,
+                               output_args=output_args, pix_fmt=pix_fmt, timeout=timeout)
+        stack.flush()
+        del stack
+        # A partly fed stack is never kept
+        if result.returncode == 0:
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if result.returncode == 0:
+        evict_intermediates(cache_dir, max_cache_bytes, keep=[path])
+    return result
+
+
+def read_intermediate(path, width, height, pix_fmt='rgb24'):
+    """Yield the frames of an intermediate as (height, width, channels) uint8 arrays"""
+    if path.endswith('.npy'):
+        yield from np.load(path, mmap_mode='r')
+        return
+    cmd = ['ffmpeg', '-loglevel', 'error', '-i', path, '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-']
+    shape = (height, width, _channels(pix_fmt))
+    frame_bytes = int(np.prod(shape))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    try:
+        while True:
+            data = proc.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(shape)
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def encode_intermediate(path, fps, output_path, output_args, pix_fmt='rgb24', timeout=60,
+                        filter_args=(), stage='encode'):
+    """Encode a cached intermediate; returns a CompletedProcess
+
+    filter_args (e.g. ['-vf', ...]) go between the input and the encoder flags.
+    """
+    if path.endswith('.npy'):
+        stack = np.load(path, mmap_mode='r')
+        frame_count, height, width = stack.shape[:3]
+        return encode_frames(iter(stack), width, height, fps, output_path,
+                             output_args=[*filter_args, *output_args], pix_fmt=pix_fmt, timeout=timeout,
+                             stage=stage)
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-i', path,
+        *filter_args,
+        *output_args,
+        output_path,
+    ]
+    return run_ffmpeg(cmd, timeout=timeout, stage=stage)
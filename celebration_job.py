@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Per-video job options shared by the SwapDotz celebration generators
+Checks which audio, ladder, VFR and tuning options can be combined, sizes
+the render for a ladder, builds encoder flags from a rarity preset, and
+writes the trajectory and poster side outputs, so both generators handle
+every option the same way
+"""
+
+import os
+
+from celebration_audio import SOUNDS_DIR, audio_supported, mux_args, sound_path
+from celebration_ffmpeg import encoder_args
+from celebration_frames import hex_to_rgb
+from celebration_posters import poster_index, write_posters
+from celebration_trajectories import export_trajectories
+
+
+def option_problem(rarity, output_path, style, renderer='numpy', ladder=None, vfr_threshold=None, tune=None,
+                   audio=None):
+    """Why a job's options cannot be rendered together, or None when they can
+
+    Ladders, VFR, tuning and audio all need the numpy renderer; audio also
+    needs a single pass (no ladder, VFR or tuning), a ladder cannot be
+    combined with VFR or tuning, and tuning picks its own constant-rate
+    encode, so it cannot be combined with VFR either.
+    """
+    if audio and not os.path.exists(sound_path(style['sound'])):
+        return f"No sound {style['sound']!r} for {rarity} in {SOUNDS_DIR}"
+    if audio and (renderer != 'numpy' or ladder or vfr_threshold is not None or tune):
+        return "Audio muxing needs the single-pass numpy renderer (no ladder, VFR or tuning)"
+    if audio and not audio_supported(output_path, audio['codec']):
+        return f"{os.path.basename(output_path)} cannot carry {audio['codec']} audio"
+    if ladder and renderer != 'numpy':
+        return "Ladder output needs the numpy renderer"
+    if ladder and (vfr_threshold is not None or tune):
+        return "Ladder output does not support VFR or encoder tuning"
+    if tune and vfr_threshold is not None:
+        return "Encoder tuning does not support VFR output"
+    if renderer != 'numpy' and (vfr_threshold is not None or tune):
+        return "VFR output and encoder tuning need the numpy renderer"
+    return None
+
+
+def render_size(width, height, fps, ladder=None):
+    """(width, height, fps) to render at; a ladder renders once at its largest
+    tier and its highest tier frame rate"""
+    if not ladder:
+        return width, height, fps
+    top = max(ladder, key=lambda tier: tier['width'] * tier['height'])
+    return top['width'], top['height'], max(tier['fps'] for tier in ladder)
+
+
+def job_output_args(style, codec, fps, crf=None, preset=None, threads=None, audio=None, duration=None):
+    """Encoder flags from the preset's profile, with the audio mux inputs in front
+
+    crf and preset override the profile. Sound inputs and the mix ride
+    along in the frame encoder's pass; the pre-roll shows the clip's
+    background, and the sound is cut at the end of the duration seconds
+    of rendered frames.
+    """
+    encoder = style['encoder']
+    output_args = encoder_args(codec, crf=encoder['crf'] if crf is None else crf,
+                               preset=preset or encoder['preset'], threads=threads)
+    if audio:
+        pad_color = 'black@0.0' if style['background'] == 'transparent' else style['background']
+        output_args = mux_args(style['sound'], duration, audio['codec'], audio['preroll'], fps, pad_color) + output_args
+    return output_args
+
+
+def write_side_outputs(output_path, scene, renderer, trajectories=False, poster_at=None):
+    """Trajectory data and poster images for a scene, written next to output_path
+
+    Posters come straight from the frame buffer, the same one the encoder
+    reads.
+    """
+    if trajectories:
+        export_trajectories(output_path, scene['start'], scene['end'], [hex_to_rgb(color) for color in scene['colors']],
+                            scene['sizes'], scene['duration'], scene['width'], scene['height'],
+                            easing=scene['easing'], fade=scene['fade'])
+    if poster_at is not None:
+        write_posters(renderer, poster_index(scene['frame_count'], poster_at), output_path)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Keyframe tables for SwapDotz celebration videos
+Precomputes per-frame particle positions, alpha and scale as compact arrays,
+with easing curves applied through vectorized lookup tables
+"""
+
+import functools
+
+import numpy as np
+
+# Cubic bezier control points of the Flutter curves used by the app
+EASING_CURVES = {
+    'linear': None,
+    'ease_in': (0.42, 0.0, 1.0, 1.0),          # Curves.easeIn
+    'ease_out': (0.0, 0.0, 0.58, 1.0),         # Curves.easeOut
+    'ease_in_out': (0.42, 0.0, 0.58, 1.0),     # Curves.easeInOut
+    'ease_out_cubic': (0.215, 0.61, 0.355, 1.0),  # Curves.easeOutCubic
+    'fast_out_slow_in': (0.4, 0.0, 0.2, 1.0),  # Curves.fastOutSlowIn
+}
+
+
+@functools.lru_cache(maxsize=None)
+def easing_lut(name, samples=4096):
+    """Sample a cubic bezier easing curve into monotonic (x, y) tables"""
+    a, b, c, d = EASING_CURVES[name]
+    s = np.linspace(0.0, 1.0, samples)
+    # Bezier from (0, 0) to (1, 1) with control points (a, b) and (c, d)
+    xs = 3 * a * (1 - s) ** 2 * s + 3 * c * (1 - s) * s ** 2 + s ** 3
+    ys = 3 * b * (1 - s) ** 2 * s + 3 * d * (1 - s) * s ** 2 + s ** 3
+    xs.setflags(write=False)
+    ys.setflags(write=False)
+    return xs, ys
+
+
+def ease(name, t):
+    """Apply a named easing curve to progress values in 0..1"""
+    t = np.clip(np.asarray(t, dtype=np.float64), 0.0, 1.0)
+    if EASING_CURVES[name] is None:
+        return t
+    xs, ys = easing_lut(name)
+    return np.interp(t, xs, ys)
+
+
+def frame_progress(duration, fps, frame_count=None):
+    """Linear 0..1 progress for every frame; frames past duration clamp to 1"""
+    if frame_count is None:
+        frame_count = int(round(duration * fps))
+    return np.clip(np.arange(frame_count) / (fps * duration), 0.0, 1.0)
+
+
+def particle_track(start, end, duration, fps, easing='linear', fade='linear',
+                   frame_count=None, grow=None):
+    """Per-frame positions (F, N, 2), alpha (F,) and scale (F,) for particles
+
+    Particles move from start to end (both (N, 2)) along the easing curve
+    and fade from 1 to 0 along the fade curve; grow, if given, eases the
+    particle scale from 0 to 1.
+    """
+    progress = frame_progress(duration, fps, frame_count)
+    start = np.asarray(start, dtype=np.float32)
+    delta = np.asarray(end, dtype=np.float32) - start
+    eased = ease(easing, progress).astype(np.float32)
+    scale = ease(grow, progress) if grow else np.ones_like(progress)
+    return {
+        'positions': start[None, :, :] + delta[None, :, :] * eased[:, None, None],
+        'alpha': (1.0 - ease(fade, progress)).astype(np.float32),
+        'scale': scale.astype(np.float32),
+    }
+
+
+def ray_track(max_length, duration, fps, easing='linear', fade='linear', opacity=1.0,
+              frame_count=None, curve='linear'):
+    """Per-frame ray length (F,) and alpha (F,) for burst rays
+
+    curve eases the controller before easing and fade see it, like
+    _buildBurstRays transforming the value it hands _BurstPainter.
+    """
+    progress = ease(curve, frame_progress(duration, fps, frame_count))
+    return {
+        'length': (max_length * ease(easing, progress)).astype(np.float32),
+        'alpha': (opacity * (1.0 - ease(fade, progress))).astype(np.float32),
+    }
+
+
+def ring_track(base_radius, growth, duration, fps, easing='ease_out', opacity=0.6, stroke=8.0,
+               frame_count=None):
+    """Per-frame radius (F,), alpha (F,) and stroke width (F,) for a shockwave
+
+    Mirrors _ShockwavePainter: the radius grows from base_radius by growth
+    while alpha and stroke width shrink with the eased progress.
+    """
+    progress = ease(easing, frame_progress(duration, fps, frame_count))
+    return {
+        'radius': (base_radius + progress * growth).astype(np.float32),
+        'alpha': (opacity * (1.0 - progress)).astype(np.float32),
+        'stroke': (stroke * (1.0 - progress)).astype(np.float32),
+    }
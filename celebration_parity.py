@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Frame parity check between rendered celebration videos and the Flutter painters
+Rasterizes _ConfettiPainter, _BurstPainter and _ShockwavePainter straight
+from the formulas in lib/screens/celebration_screen.dart, independently of
+the video renderer, and scores frames against them with batched NumPy
+SSIM and PSNR, so a render that drifts from the app fails. The farm scores
+the frames a render hands its encoder; the command line scores a decoded
+video.
+
+Confetti placement in the reference comes from dart_random, so the check
+can only be as faithful to the device as that port is to the Dart VM.
+"""
+
+import argparse
+import functools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from celebration_ffmpeg import CODECS, fps_mode_args
+from celebration_frames import color_lerp, hex_to_rgb
+from celebration_keyframes import ease
+from dart_random import confetti_draws
+
+# Flutter's accent colors used by the celebration painters
+CYAN_ACCENT = '#18FFFF'
+ORANGE_ACCENT = '#FFAB40'
+AMBER_ACCENT = '#FFD740'
+
+# AnimationController durations in celebration_screen.dart, in seconds
+CONFETTI_DURATION = 1.5
+BURST_DURATION = 1.2
+SHOCKWAVE_DURATION = 2.0
+
+# _ConfettiPainter seeds its Random with a constant
+FLUTTER_SEED = 42
+
+# Per rarity: confetti count, burst ray count (0 = none), shockwave
+PAINTERS = {
+    'common': (30, 0, False),
+    'uncommon': (60, 32, False),
+    'rare': (100, 48, True),
+}
+
+# Default pass marks: the lowest per-frame SSIM and PSNR a render may score.
+# Raw frames score 0.98+ / 55+ dB; a decoded encode carries the encoder's
+# loss on top and gets lower marks
+MIN_SSIM = 0.95
+MIN_PSNR = 40.0
+MIN_ENCODED_SSIM = 0.90
+MIN_ENCODED_PSNR = 25.0
+
+# How far a render may fall below its recorded baseline before it fails
+SSIM_TOLERANCE = 0.02
+PSNR_TOLERANCE = 1.0
+
+# Frames scored per NumPy batch; bounds memory at 720x1280
+BATCH_FRAMES = 8
+
+# SSIM windows are 8x8 on a 4-pixel grid, like ffmpeg's ssim filter;
+# constants for 8-bit data (Wang et al., 2004)
+_WINDOW = 8
+_STRIDE = 4
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+@functools.lru_cache(maxsize=None)
+def _confetti(count):
+    """Random(42) draws and lerped colors for a confetti count, computed once"""
+    draws = confetti_draws(count, FLUTTER_SEED)
+    colors = [hex_to_rgb(color) for color in color_lerp(CYAN_ACCENT, ORANGE_ACCENT, draws['color'])]
+    return draws, colors
+
+
+def _coverage(distance, half_width):
+    """Anti-aliased coverage of a shape edge: one pixel of linear falloff"""
+    return np.clip(half_width + 0.5 - distance, 0.0, 1.0)
+
+
+def _over(frame, x0, y0, coverage, rgb, alpha):
+    """SrcOver a solid color with per-pixel coverage onto a premultiplied RGB frame
+
+    Only covered pixels are touched, so thin strokes with a large bounding
+    box (the shockwave ring) stay cheap.
+    """
+    rows, cols = np.nonzero(coverage)
+    a = (coverage[rows, cols] * alpha).astype(np.float32)[:, None]
+    rows += y0
+    cols += x0
+    frame[rows, cols] = frame[rows, cols] * (1.0 - a) + a * rgb
+
+
+def _window(cx, cy, reach, width, height):
+    """Clipped pixel grid around (cx, cy): x0, y0 and the pixel-center offsets"""
+    x0, x1 = max(int(np.floor(cx - reach)), 0), min(int(np.ceil(cx + reach)) + 1, width)
+    y0, y1 = max(int(np.floor(cy - reach)), 0), min(int(np.ceil(cy + reach)) + 1, height)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    xs = np.arange(x0, x1) + 0.5 - cx
+    ys = np.arange(y0, y1) + 0.5 - cy
+    return x0, y0, xs[None, :], ys[:, None]
+
+
+def reference_frame(rarity, width, height, time):
+    """Rasterize the rarity's Flutter painters at `time` seconds as float RGB over black"""
+    count, ray_count, shockwave = PAINTERS[rarity]
+    frame = np.zeros((height, width, 3), dtype=np.float32)
+    shortest = min(width, height)
+    center_x, center_y = width / 2, height / 3
+
+    # _ConfettiPainter: Random(42) draws angle, radius, color, size per particle
+    progress = min(time / CONFETTI_DURATION, 1.0)
+    draws, colors = _confetti(count)
+    radii = progress * shortest * 0.6 * draws['radius']
+    for angle, radius, color, size in zip(draws['angle'], radii, colors, draws['size']):
+        cx, cy = center_x + np.cos(angle) * radius, center_y + np.sin(angle) * radius
+        grid = _window(cx, cy, size + 1, width, height)
+        if grid is not None and progress < 1.0:
+            x0, y0, xs, ys = grid
+            _over(frame, x0, y0, _coverage(np.hypot(xs, ys), size), color, 1.0 - progress)
+
+    # _BurstPainter: the builder eases the controller, the painter eases again
+    if ray_count:
+        progress = float(ease('ease_out', min(time / BURST_DURATION, 1.0)))
+        length = shortest * 0.15 * float(ease('ease_out', progress))
+        alpha = (1.0 - progress) * 0.8
+        rgb = hex_to_rgb(AMBER_ACCENT)
+        for index in range(ray_count if alpha > 0 else 0):
+            angle = 2 * np.pi / ray_count * index
+            dx, dy = np.cos(angle), np.sin(angle)
+            # Only the pixels around this segment: center -> center + length * (dx, dy)
+            mid_x, mid_y = center_x + dx * length / 2, center_y + dy * length / 2
+            reach_x, reach_y = abs(dx) * length / 2 + 2, abs(dy) * length / 2 + 2
+            x0, x1 = max(int(mid_x - reach_x), 0), min(int(np.ceil(mid_x + reach_x)) + 1, width)
+            y0, y1 = max(int(mid_y - reach_y), 0), min(int(np.ceil(mid_y + reach_y)) + 1, height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            xs = (np.arange(x0, x1) + 0.5 - center_x)[None, :]
+            ys = (np.arange(y0, y1) + 0.5 - center_y)[:, None]
+            # Distance to the segment, which gives the round caps
+            along = np.clip(xs * dx + ys * dy, 0.0, length)
+            distance = np.hypot(xs - along * dx, ys - along * dy)
+            _over(frame, x0, y0, _coverage(distance, 1.0), rgb, alpha)
+
+    # _ShockwavePainter: stroked circle on an eased controller
+    if shockwave:
+        progress = float(ease('ease_out', min(time / SHOCKWAVE_DURATION, 1.0)))
+        radius = shortest * 0.1 + progress * shortest * 0.4
+        stroke = 8 * (1.0 - progress)
+        alpha = (1.0 - progress) * 0.6
+        grid = _window(center_x, center_y, radius + stroke, width, height)
+        if grid is not None and stroke > 0:
+            x0, y0, xs, ys = grid
+            distance = np.abs(np.hypot(xs, ys) - radius)
+            _over(frame, x0, y0, _coverage(distance, stroke / 2), hex_to_rgb(AMBER_ACCENT), alpha)
+
+    return np.round(np.clip(frame, 0.0, 1.0) * 255.0).astype(np.uint8)
+
+
+def decode_frames(path, width, height, fps, codec='h264', timeout=60):
+    """Decode a video as uint8 RGB frames over black, resampled to a constant fps
+
+    Alpha outputs are composited over black like the reference.
+    """
+    decoder = CODECS[codec].get('decoder', [])
+    if decoder == 'pillow':
+        raise ValueError(f"{codec} output cannot be decoded by ffmpeg for parity")
+    alpha = CODECS[codec]['alpha']
+    cmd = [
+        'ffmpeg', '-loglevel', 'error', *decoder, '-i', path, '-an',
+        '-vf', f"scale={width}:{height}", *fps_mode_args('cfr'), '-r', str(fps),
+        '-f', 'rawvideo', '-pix_fmt', 'rgba' if alpha else 'rgb24', '-',
+    ]
+    data = subprocess.run(cmd, capture_output=True, timeout=timeout, check=True).stdout
+    frames = np.frombuffer(data, dtype=np.uint8).reshape(-1, height, width, 4 if alpha else 3)
+    if alpha:
+        straight = frames[..., :3].astype(np.uint16) * frames[..., 3:]
+        frames = ((straight + 127) // 255).astype(np.uint8)
+    return frames
+
+
+def _luma(frames):
+    """BT.601 luma of a (B, H, W, 3) uint8 batch as float64"""
+    return frames.astype(np.float64) @ np.array([0.299, 0.587, 0.114])
+
+
+def _box_sums(values, size, stride):
+    """Sums over size x size windows every stride pixels of a (B, H, W) batch, via integral images"""
+    integral = np.zeros((values.shape[0], values.shape[1] + 1, values.shape[2] + 1))
+    integral[:, 1:, 1:] = values.cumsum(axis=1).cumsum(axis=2)
+    top, left = slice(0, -size, stride), slice(0, -size, stride)
+    bottom, right = slice(size, None, stride), slice(size, None, stride)
+    return (integral[:, bottom, right] - integral[:, top, right]
+            - integral[:, bottom, left] + integral[:, top, left])
+
+
+def _content_box(a, b, margin):
+    """Row and column slices covering every non-black pixel of two batches, plus margin"""
+    # Reduce over the batch axis first: contiguous and much faster than any()
+    mask = (np.maximum(a.max(axis=0), b.max(axis=0)).max(axis=2)) > 0
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return None
+    return (slice(max(rows[0] - margin, 0), rows[-1] + margin + 1),
+            slice(max(cols[0] - margin, 0), cols[-1] + margin + 1))
+
+
+def batch_ssim(a, b, window=_WINDOW, stride=_STRIDE):
+    """Mean luma SSIM per frame for two (B, H, W, 3) uint8 batches
+
+    Window statistics come from integral images for the whole batch at
+    once. Only windows with content in either frame count, so small
+    particles on a mostly empty frame are not averaged away; the batch is
+    cropped to its content first, and a frame empty in both scores 1.
+    """
+    box = _content_box(a, b, window)
+    if box is None:
+        return np.ones(len(a))
+    x, y = _luma(a[:, box[0], box[1]]), _luma(b[:, box[0], box[1]])
+    if min(x.shape[1:]) <= window:
+        x = np.pad(x, ((0, 0), (0, window), (0, window)))
+        y = np.pad(y, ((0, 0), (0, window), (0, window)))
+    n = window * window
+    mu_x, mu_y = _box_sums(x, window, stride) / n, _box_sums(y, window, stride) / n
+    var_x = _box_sums(x * x, window, stride) / n - mu_x ** 2
+    var_y = _box_sums(y * y, window, stride) / n - mu_y ** 2
+    cov = _box_sums(x * y, window, stride) / n - mu_x * mu_y
+    ssim = ((2 * mu_x * mu_y + _C1) * (2 * cov + _C2)) / ((mu_x ** 2 + mu_y ** 2 + _C1) * (var_x + var_y + _C2))
+    content = (mu_x > 0.5) | (mu_y > 0.5)
+    counts = content.sum(axis=(1, 2))
+    return np.where(counts > 0, (ssim * content).sum(axis=(1, 2)) / np.maximum(counts, 1), 1.0)
+
+
+def batch_psnr(a, b):
+    """RGB PSNR in dB per frame for two (B, H, W, 3) uint8 batches (100 when identical)
+
+    Pixels outside the content box are black in both, so only the box is
+    differenced; the error is still averaged over the full frame.
+    """
+    box = _content_box(a, b, 0)
+    if box is None:
+        return np.full(len(a), 100.0)
+    diff = a[:, box[0], box[1]].astype(np.int32) - b[:, box[0], box[1]]
+    mse = (diff * diff).sum(axis=(1, 2, 3)) / (a[0].size)
+    with np.errstate(divide='ignore'):
+        return np.minimum(10 * np.log10(255.0 ** 2 / mse), 100.0)
+
+
+class ParityScorer:
+    """Scores frames against the Flutter painters as they stream past
+
+    add() takes each (H, W, 3) RGB frame over black, or straight-alpha RGBA
+    frame, in clip order, copying it (renderers reuse one buffer); frames
+    are scored BATCH_FRAMES at a time. An exception while scoring is kept in
+    'error' instead of raised, so it cannot break the encode feeding it.
+    """
+
+    def __init__(self, rarity, width, height, fps=30):
+        self.rarity, self.width, self.height, self.fps = rarity, width, height, fps
+        self.ssim, self.psnr = [], []
+        self.batch = []
+        self.error = None
+        self.seconds = 0.0
+
+    @property
+    def frames(self):
+        return len(self.ssim) + len(self.batch)
+
+    def add(self, frame):
+        if self.error is not None:
+            return
+        frame = np.array(frame, dtype=np.uint8).reshape(self.height, self.width, -1)
+        if frame.shape[-1] == 4:
+            frame = ((frame[..., :3].astype(np.uint16) * frame[..., 3:] + 127) // 255).astype(np.uint8)
+        self.batch.append(frame)
+        if len(self.batch) == BATCH_FRAMES:
+            self._score()
+
+    def _score(self):
+        started = time.perf_counter()
+        try:
+            batch = np.stack(self.batch)
+            start = len(self.ssim)
+            reference = np.stack([reference_frame(self.rarity, self.width, self.height, index / self.fps)
+                                  for index in range(start, start + len(batch))])
+            self.ssim.extend(batch_ssim(batch, reference))
+            self.psnr.extend(batch_psnr(batch, reference))
+        except Exception as exc:  # reported with the scores, never raised into the encoder
+            self.error = f"{type(exc).__name__}: {exc}"
+        self.batch = []
+        self.seconds += time.perf_counter() - started
+
+    def report(self, min_ssim=MIN_SSIM, min_psnr=MIN_PSNR):
+        """Per-frame 'ssim' and 'psnr' lists, their minima and means, the worst
+        frame and 'passed' (every frame meets both marks)"""
+        if self.batch and self.error is None:
+            self._score()
+        if self.error is not None:
+            return {'frames': self.frames, 'error': self.error, 'passed': False}
+        ssim, psnr = np.array(self.ssim), np.array(self.psnr)
+        return {
+            'frames': len(ssim),
+            'ssim': np.round(ssim, 5).tolist(),
+            'psnr': np.round(psnr, 2).tolist(),
+            'min_ssim': round(float(ssim.min()), 5) if len(ssim) else 0.0,
+            'mean_ssim': round(float(ssim.mean()), 5) if len(ssim) else 0.0,
+            'min_psnr': round(float(psnr.min()), 2) if len(psnr) else 0.0,
+            'mean_psnr': round(float(psnr.mean()), 2) if len(psnr) else 0.0,
+            'worst_frame': int(np.argmin(ssim)) if len(ssim) else 0,
+            'passed': bool(len(ssim)) and bool(ssim.min() >= min_ssim and psnr.min() >= min_psnr),
+        }
+
+
+def score_frames(frames, rarity, width, height, fps=30, min_ssim=MIN_SSIM, min_psnr=MIN_PSNR):
+    """Score uint8 frames against the Flutter painters; returns ParityScorer.report()"""
+    scorer = ParityScorer(rarity, width, height, fps)
+    for frame in frames:
+        scorer.add(frame)
+    return scorer.report(min_ssim, min_psnr)
+
+
+def check_parity(path, rarity, width, height, fps=30, codec='h264', min_ssim=MIN_ENCODED_SSIM,
+                 min_psnr=MIN_ENCODED_PSNR, timeout=60, offset=0.0):
+    """Score a rendered video against the Flutter painters frame by frame
+
+    offset skips that many seconds of lead-in (e.g. an audio pre-roll).
+    Returns the score_frames report.
+    """
+    video = decode_frames(path, width, height, fps, codec, timeout)[int(round(offset * fps)):]
+    return score_frames(video, rarity, width, height, fps, min_ssim, min_psnr)
+
+
+def summary(report):
+    """The scores kept in a parity baseline"""
+    return {key: report[key] for key in ('min_ssim', 'mean_ssim', 'min_psnr', 'mean_psnr')}
+
+
+def load_baseline(path):
+    """Recorded parity scores per job name, or {} when there is no baseline yet"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def parity_regressions(report, baseline, ssim_tolerance=SSIM_TOLERANCE, psnr_tolerance=PSNR_TOLERANCE):
+    """Scores that fell below a baseline entry by more than the tolerance"""
+    regressions = []
+    for key, value in summary(report).items():
+        tolerance = ssim_tolerance if 'ssim' in key else psnr_tolerance
+        if key in baseline and value < baseline[key] - tolerance:
+            regressions.append(f"{key} {value} < baseline {baseline[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check celebration videos against the Flutter painters")
+    parser.add_argument("video", help="Rendered celebration video")
+    parser.add_argument("--rarity", choices=sorted(PAINTERS), required=True)
+    parser.add_argument("--width", type=int, default=720)
+    parser.add_argument("--height", type=int, default=1280)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--codec", choices=sorted(CODECS), default="h264")
+    parser.add_argument("--min-ssim", type=float, default=MIN_ENCODED_SSIM)
+    parser.add_argument("--min-psnr", type=float, default=MIN_ENCODED_PSNR)
+    parser.add_argument("--json", action="store_true", help="Print the full per-frame report")
+    args = parser.parse_args()
+
+    report = check_parity(args.video, args.rarity, args.width, args.height, args.fps, args.codec,
+                          args.min_ssim, args.min_psnr)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    marker = "✅" if report['passed'] else "❌"
+    print(f"{marker} {args.rarity}: SSIM min {report['min_ssim']:.4f} (mean {report['mean_ssim']:.4f}), "
+          f"PSNR min {report['min_psnr']:.1f} dB (mean {report['mean_psnr']:.1f} dB), "
+          f"worst frame {report['worst_frame']}")
+    return report['passed']
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
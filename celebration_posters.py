@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Poster frames and blurred placeholders for SwapDotz celebration videos
+Grabs one frame straight from the NumPy frame buffer, so the app has an
+image to show before the video decoder has started, without decoding the
+encoded output again
+"""
+
+import os
+
+# Placeholder width in pixels; the height keeps the clip's aspect ratio
+PLACEHOLDER_WIDTH = 16
+
+
+def poster_index(frame_count, progress):
+    """Frame number at a clip progress in 0..1 (e.g. 0.3 for peak burst)"""
+    progress = min(max(float(progress), 0.0), 1.0)
+    return min(int(round(progress * (frame_count - 1))), frame_count - 1)
+
+
+def poster_paths(output_path):
+    """(poster, placeholder) PNG paths next to a video"""
+    stem = os.path.splitext(output_path)[0]
+    return f"{stem}_poster.png", f"{stem}_placeholder.png"
+
+
+def write_posters(renderer, frame_index, output_path, placeholder_width=PLACEHOLDER_WIDTH, blur=1.0):
+    """Render frame_index and save it as a poster plus a tiny blurred placeholder
+
+    Both keep straight alpha so transparent celebrations still composite
+    over the app UI. Returns the (poster, placeholder) paths.
+    """
+    from PIL import Image, ImageFilter
+
+    renderer.render(frame_index)
+    poster = Image.fromarray(renderer.to_rgba(), 'RGBA')
+    poster_path, placeholder_path = poster_paths(output_path)
+    poster.save(poster_path, optimize=True)
+
+    height = max(1, round(placeholder_width * renderer.height / renderer.width))
+    # Resample and blur premultiplied so transparent pixels do not bleed black
+    placeholder = poster.convert('RGBa').resize((placeholder_width, height), Image.BOX)
+    placeholder = placeholder.filter(ImageFilter.GaussianBlur(blur)).convert('RGBA')
+    placeholder.save(placeholder_path, optimize=True)
+
+    print(f"   Poster: frame {frame_index}, {os.path.getsize(poster_path) / 1024:.1f} KB + "
+          f"{os.path.getsize(placeholder_path)} B placeholder")
+    return poster_path, placeholder_path
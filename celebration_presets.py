@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Rarity presets for SwapDotz celebration assets
+Loads and validates the preset file (celebration_presets.json, or a TOML
+file with the same layout) holding particle counts, colors, sizes, easing,
+effects and encoder profile for every rarity of both generators, so a new
+tier is a preset entry rather than new code
+"""
+
+import functools
+import json
+import os
+import re
+
+import numpy as np
+
+from celebration_ffmpeg import PRESETS
+from celebration_keyframes import EASING_CURVES, ray_track, ring_track
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: JSON presets only
+    tomllib = None
+
+PRESET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'celebration_presets.json')
+GENERATORS = ('celebration', 'dramatic')
+
+# Effect options and their defaults, which are the Flutter painters' own;
+# lengths and radii are shares of the frame's shortest side. Burst rays run
+# on their own controller, eased by curve before easing and fade apply
+EFFECTS = {
+    'burst_rays': {'count': 32, 'color': '#FFD740', 'length': 0.15, 'duration': 1.2, 'curve': 'ease_out',
+                   'easing': 'ease_out', 'fade': 'linear', 'opacity': 0.8, 'stroke': 2.0},
+    'shockwave': {'color': '#FFD740', 'radius': 0.1, 'growth': 0.4, 'duration': 2.0, 'easing': 'ease_out',
+                  'opacity': 0.6, 'stroke': 8.0},
+}
+
+# Optional rarity fields; sound defaults to the rarity's own SwapSounds clip
+OPTIONAL = {'effects': {}, 'speed': 1.0, 'sound': None}
+
+_REQUIRED = ('duration', 'background', 'particles', 'colors', 'size', 'easing', 'fade', 'encoder')
+_HEX_COLOR = re.compile(r'^#[0-9A-Fa-f]{6}$')
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_rarity(where, preset):
+    """Problems with one merged rarity preset, as 'where.field: message' strings"""
+    problems = [f"{where}: missing {field}" for field in _REQUIRED if field not in preset]
+    unknown = set(preset) - set(_REQUIRED) - set(OPTIONAL)
+    problems += [f"{where}: unknown field {field}" for field in sorted(unknown)]
+
+    def check(field, ok, message):
+        if field in preset and not ok(preset[field]):
+            problems.append(f"{where}.{field}: {message}")
+
+    check('duration', lambda v: _number(v) and v > 0, "must be a positive number")
+    check('speed', lambda v: _number(v) and v > 0, "must be a positive number")
+    check('background', lambda v: v == 'transparent' or bool(_HEX_COLOR.match(str(v))),
+          "must be 'transparent' or #RRGGBB")
+    check('particles', lambda v: isinstance(v, int) and not isinstance(v, bool) and v >= 0,
+          "must be a whole number >= 0")
+    check('colors', lambda v: isinstance(v, list) and len(v) == 2 and all(_HEX_COLOR.match(str(c)) for c in v),
+          "must be two #RRGGBB colors")
+    check('size', lambda v: isinstance(v, list) and len(v) == 2 and all(_number(s) for s in v) and 0 < v[0] <= v[1],
+          "must be [min, max] diameters in pixels with 0 < min <= max")
+    for field in ('easing', 'fade'):
+        check(field, lambda v: v in EASING_CURVES, f"must be one of {', '.join(EASING_CURVES)}")
+    check('encoder', lambda v: isinstance(v, dict) and set(v) == {'crf', 'preset'}
+          and isinstance(v['crf'], int) and 0 <= v['crf'] <= 51 and v['preset'] in PRESETS,
+          "must be {crf: 0-51, preset: an x264 preset name}")
+    check('sound', lambda v: v is None or isinstance(v, str), "must be a SwapSounds clip name")
+
+    effects = preset.get('effects', {})
+    if not isinstance(effects, dict):
+        return problems + [f"{where}.effects: must be a table of effect options"]
+    for name, options in effects.items():
+        if name not in EFFECTS:
+            problems.append(f"{where}.effects: unknown effect {name} (known: {', '.join(EFFECTS)})")
+        elif not isinstance(options, dict) or set(options) - set(EFFECTS[name]):
+            problems.append(f"{where}.effects.{name}: options must be among {', '.join(EFFECTS[name])}")
+        else:
+            for option, value in dict(EFFECTS[name], **options).items():
+                default = EFFECTS[name][option]
+                if isinstance(default, str) and default.startswith('#'):
+                    ok = bool(_HEX_COLOR.match(str(value)))
+                elif option in ('curve', 'easing', 'fade'):
+                    ok = value in EASING_CURVES
+                elif option == 'count':
+                    ok = isinstance(value, int) and not isinstance(value, bool) and value > 0
+                elif option == 'duration':
+                    ok = _number(value) and value > 0
+                else:
+                    ok = _number(value) and value >= 0
+                if not ok:
+                    problems.append(f"{where}.effects.{name}.{option}: bad value {value!r}")
+    return problems
+
+
+def resolve_presets(data):
+    """Merge defaults into every rarity and validate the result
+
+    Returns {generator: {rarity: preset}} with effect options filled in;
+    raises ValueError listing every problem found.
+    """
+    problems = []
+    resolved = {}
+    if not isinstance(data, dict):
+        raise ValueError("presets: expected a table of generators")
+    problems += [f"presets: unknown generator {name}" for name in data if name not in GENERATORS]
+    for generator in GENERATORS:
+        section = data.get(generator)
+        if not isinstance(section, dict) or not isinstance(section.get('rarities'), dict):
+            problems.append(f"{generator}: missing rarities table")
+            continue
+        defaults = section.get('defaults', {})
+        if not isinstance(defaults, dict):
+            problems.append(f"{generator}.defaults: expected a table")
+            continue
+        resolved[generator] = {}
+        for rarity, entry in section['rarities'].items():
+            where = f"{generator}.rarities.{rarity}"
+            if not isinstance(entry, dict):
+                problems.append(f"{where}: expected a table")
+                continue
+            preset = {**OPTIONAL, **defaults, **entry}
+            found = _check_rarity(where, preset)
+            problems += found
+            if not found:
+                preset['effects'] = {name: dict(EFFECTS[name], **options) for name, options in preset['effects'].items()}
+                preset['sound'] = preset['sound'] or rarity
+                resolved[generator][rarity] = preset
+    if problems:
+        raise ValueError("Invalid celebration presets:\n  " + "\n  ".join(problems))
+    return resolved
+
+
+@functools.lru_cache(maxsize=8)
+def _load(path, mtime_ns):
+    with open(path, 'rb') as f:
+        if path.endswith('.toml'):
+            if tomllib is None:
+                raise ValueError(f"{path}: TOML presets need Python 3.11+")
+            data = tomllib.load(f)
+        else:
+            data = json.load(f)
+    return resolve_presets(data)
+
+
+def load_presets(path=None):
+    """Validated presets from a JSON or TOML file, parsed once per file version
+
+    The cache is keyed on the file's modification time, so an edited file
+    is picked up on the next call.
+    """
+    path = os.path.abspath(path or PRESET_FILE)
+    return _load(path, os.stat(path).st_mtime_ns)
+
+
+def preset_rarities(generator='celebration', path=None):
+    """Rarity names one generator has presets for, in file order"""
+    return list(load_presets(path)[generator])
+
+
+def rarity_preset(generator, rarity, path=None):
+    """The merged preset for one rarity; ValueError when there is none"""
+    presets = load_presets(path)[generator]
+    if rarity not in presets:
+        raise ValueError(f"No {generator} preset for {rarity!r} (have: {', '.join(presets)})")
+    return presets[rarity]
+
+
+def _read_only(value):
+    """Mark every array in a table structure read-only, since it is shared"""
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _read_only(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _read_only(item)
+    return value
+
+
+def memoize_tables(function, maxsize=32):
+    """Cache a table builder whose arguments are presets and plain values
+
+    Arguments are keyed by their JSON, so an edited preset is a new entry;
+    cached arrays are read-only because every caller shares them.
+    """
+    @functools.lru_cache(maxsize=maxsize)
+    def cached(key):
+        args, kwargs = json.loads(key)
+        return _read_only(function(*args, **kwargs))
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return cached(json.dumps([args, kwargs], sort_keys=True))
+
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+def effect_tables(preset, width, height, fps, frame_count):
+    """Keyframe tables for a preset's burst rays and shockwave
+
+    Returns ray_count, ray_length, rays, ray_color, ray_stroke, shockwave
+    and shockwave_color; a missing effect has ray_count 0 or shockwave
+    None. Rays and the shockwave keep their own durations and are cut off
+    with the clip.
+    """
+    shortest_side = min(width, height)
+    effects = preset['effects']
+    tables = {'ray_count': 0, 'ray_length': 0.0, 'rays': None, 'ray_color': None, 'ray_stroke': 0.0,
+              'shockwave': None, 'shockwave_color': None}
+    if 'burst_rays' in effects:
+        rays = effects['burst_rays']
+        tables.update(ray_count=rays['count'], ray_length=shortest_side * rays['length'], ray_color=rays['color'],
+                      ray_stroke=rays['stroke'])
+        tables['rays'] = ray_track(tables['ray_length'], rays['duration'], fps, easing=rays['easing'],
+                                   fade=rays['fade'], opacity=rays['opacity'], frame_count=frame_count,
+                                   curve=rays['curve'])
+    if 'shockwave' in effects:
+        ring = effects['shockwave']
+        tables['shockwave'] = ring_track(shortest_side * ring['radius'], shortest_side * ring['growth'],
+                                         ring['duration'], fps, easing=ring['easing'], opacity=ring['opacity'],
+                                         stroke=ring['stroke'], frame_count=frame_count)
+        tables['shockwave_color'] = ring['color']
+    return tables
+
+
+def add_effects(renderer, center_x, center_y, tables):
+    """Draw effect_tables on a FrameRenderer in Flutter's order: rays, then the shockwave"""
+    if tables['ray_count']:
+        renderer.add_rays(center_x, center_y, tables['ray_count'], tables['rays'], tables['ray_color'],
+                          tables['ray_stroke'])
+    if tables['shockwave'] is not None:
+        renderer.add_ring(center_x, center_y, tables['shockwave'], tables['shockwave_color'])
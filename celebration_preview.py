@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Live preview server for SwapDotz celebration presets
+Serves the NumPy frame renderer's output on localhost as an MJPEG stream
+with no video encode, and rebuilds the scene as soon as the preset file
+changes, so tuning a preset costs one frame render instead of a full encode
+"""
+
+import argparse
+import io
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from celebration_farm import parse_resolution
+from celebration_posters import poster_index
+from celebration_presets import GENERATORS, PRESET_FILE, preset_rarities
+
+_BOUNDARY = 'celebration-frame'
+
+_PAGE = """<!DOCTYPE html>
+<html><head><title>{title}</title></head>
+<body style="margin:0;background:#202020;color:#ccc;font-family:sans-serif;text-align:center">
+<p>{title} &mdash; edit {presets} and the stream picks it up</p>
+<img src="/stream.mjpg" width="{width}" height="{height}" style="background:#000">
+</body></html>
+"""
+
+
+class PreviewSource:
+    """Renderer for one generator and rarity, rebuilt when the preset file changes
+
+    Frames render on demand under a lock, since the renderer's dirty-tile
+    state is shared by every connected client. A preset file that fails to
+    load keeps the last good scene on screen.
+    """
+
+    def __init__(self, generator, rarity, width, height, fps=30, seed=42, presets=None, quality=80):
+        self.generator, self.rarity = generator, rarity
+        self.width, self.height, self.fps, self.seed = width, height, fps, seed
+        self.presets = os.path.abspath(presets or PRESET_FILE)
+        self.quality = quality
+        self.lock = threading.RLock()
+        self.renderer = None
+        self.frame_count = 0
+        self.version = None
+        self.refresh()
+        if self.renderer is None:
+            raise ValueError(f"Cannot preview {generator} {rarity!r} with {self.presets}")
+
+    def refresh(self):
+        """Rebuild the renderer if the preset file changed; True when it did"""
+        try:
+            version = os.stat(self.presets).st_mtime_ns
+        except OSError:
+            return False
+        if version == self.version:
+            return False
+        self.version = version
+        started = time.perf_counter()
+        try:
+            renderer, frame_count = self._build()
+        except (OSError, ValueError) as e:
+            print(f"❌ {e}")
+            return False
+        with self.lock:
+            self.renderer, self.frame_count = renderer, frame_count
+            self.jpeg(0)
+        print(f"✅ {self.generator} {self.rarity}: {frame_count} frames, first frame in "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms")
+        return True
+
+    def _build(self):
+        # Imported here so each generator's scene code loads only when used
+        if self.generator == 'dramatic':
+            from generate_better_celebration_videos import dramatic_renderer, dramatic_scene
+            scene = dramatic_scene(self.rarity, self.width, self.height, self.seed, self.fps, presets=self.presets)
+            return dramatic_renderer(scene), scene['frame_count']
+        from generate_celebration_videos import celebration_scene, scene_renderer
+        scene = celebration_scene(self.rarity, self.width, self.height, self.seed, self.fps, presets=self.presets)
+        return scene_renderer(scene), scene['frame_count']
+
+    def jpeg(self, index):
+        """Render one frame, flattened over black, as JPEG bytes"""
+        from PIL import Image
+
+        with self.lock:
+            self.renderer.render(min(index, self.frame_count - 1))
+            buffer = io.BytesIO()
+            Image.fromarray(self.renderer.to_rgb24(), 'RGB').save(buffer, 'JPEG', quality=self.quality)
+        return buffer.getvalue()
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    """/ (viewer page), /stream.mjpg (looping clip) and /frame.jpg?progress=0..1"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        source = self.server.source
+        if url.path == '/':
+            title = f"{source.generator} {source.rarity} preview"
+            page = _PAGE.format(title=title, presets=os.path.basename(source.presets), width=source.width,
+                                height=source.height).encode()
+            self._reply('text/html; charset=utf-8', page)
+        elif url.path == '/frame.jpg':
+            source.refresh()
+            try:
+                progress = float(parse_qs(url.query).get('progress', ['0'])[0])
+            except ValueError:
+                self.send_error(400, "progress must be a number between 0 and 1")
+                return
+            self._reply('image/jpeg', source.jpeg(poster_index(source.frame_count, progress)))
+        elif url.path == '/stream.mjpg':
+            self._stream(source)
+        else:
+            self.send_error(404)
+
+    def _reply(self, content_type, body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, source):
+        """Loop the clip at its frame rate, restarting it when the presets change"""
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={_BOUNDARY}')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        index = 0
+        deadline = time.perf_counter()
+        try:
+            while True:
+                if source.refresh() or index >= source.frame_count:
+                    index = 0
+                frame = source.jpeg(index)
+                self.wfile.write(f"--{_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(frame)}\r\n\r\n".encode())
+                self.wfile.write(frame + b"\r\n")
+                index += 1
+                # Hold the clip's frame rate; a slow render just drops the wait
+                deadline = max(deadline + 1.0 / source.fps, time.perf_counter())
+                time.sleep(max(0.0, deadline - time.perf_counter()))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # viewer went away
+
+    def log_message(self, format, *args):
+        pass  # one line per MJPEG part would drown the reload messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preview celebration presets live in the browser")
+    parser.add_argument("--generator", choices=GENERATORS, default='celebration',
+                        help="Which generator's presets to preview (default: celebration)")
+    parser.add_argument("--rarity", default='rare', help="Rarity to preview (default: rare)")
+    parser.add_argument("--presets", default=None,
+                        help="Rarity preset file to watch (default: celebration_presets.json)")
+    parser.add_argument("--resolution", type=parse_resolution, default=(360, 640), metavar="WxH",
+                        help="Preview size (default: 360x640)")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42, help="Particle seed")
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality (default: 80)")
+    parser.add_argument("--host", default='127.0.0.1', help="Address to bind (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    try:
+        rarities = preset_rarities(args.generator, args.presets)
+        if args.rarity not in rarities:
+            raise ValueError(f"No {args.generator} preset for {args.rarity!r} (have: {', '.join(rarities)})")
+        width, height = args.resolution
+        source = PreviewSource(args.generator, args.rarity, width, height, args.fps, args.seed, args.presets,
+                               args.quality)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return False
+
+    server = ThreadingHTTPServer((args.host, args.port), PreviewHandler)
+    server.daemon_threads = True
+    server.source = source
+    print(f"Previewing {args.generator} {args.rarity} at http://{args.host}:{server.server_port}/ "
+          f"(watching {source.presets}, Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing for SwapDotz celebration video generation
+Graph build, render, encode and mux steps record their wall time here so
+every farm run can write a JSON timing report for regression tracking
+"""
+
+import contextlib
+import json
+import time
+
+# Stages recorded in this process since the last collect()
+_stages = []
+
+
+@contextlib.contextmanager
+def stage(name, **info):
+    """Time a block as one named stage; the yielded dict takes extra fields"""
+    record = dict(info, stage=name)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = round(time.perf_counter() - started, 3)
+        _stages.append(record)
+
+
+def recorded():
+    """The stages recorded so far, without clearing them"""
+    return list(_stages)
+
+
+def collect():
+    """Return and clear the stages recorded so far, in completion order"""
+    stages = list(_stages)
+    _stages.clear()
+    return stages
+
+
+def write_timing_report(path, results):
+    """Write per-job stage timings plus per-stage totals as JSON"""
+    totals = {}
+    for result in results:
+        for record in result.get('stages', []):
+            totals[record['stage']] = round(totals.get(record['stage'], 0.0) + record['seconds'], 3)
+    report = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'totals': totals,
+        'jobs': [
+            {'name': result['name'], 'status': result['status'], 'wall_time': result['wall_time'],
+             'stages': result.get('stages', [])}
+            for result in results
+        ],
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
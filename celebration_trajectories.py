@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Particle trajectory export for replaying celebrations on the device
+Writes each particle's start, end, color and size plus the easing curves as
+a packed little-endian float32 struct array, so a CustomPainter can load it
+once and animate without any per-frame random-number work
+
+Layout: a 32-byte header followed by `count` 36-byte records
+    header: magic b'SDZT', u16 version, u16 flags (reserved, 0),
+            u32 count, f32 duration (s), f32 width, f32 height,
+            u16 easing id, u16 fade id, u32 record size
+    record: f32 start x, start y, end x, end y, r, g, b, a (0..1), diameter
+"""
+
+import os
+import struct
+import time
+
+import numpy as np
+
+from celebration_keyframes import EASING_CURVES
+
+MAGIC = b'SDZT'
+VERSION = 1
+# Easing ids are positions in EASING_CURVES; append new curves, never reorder
+EASING_IDS = tuple(EASING_CURVES)
+HEADER = struct.Struct('<4sHHIfffHHI')
+RECORD = np.dtype([
+    ('start', '<f4', 2),
+    ('end', '<f4', 2),
+    ('color', '<f4', 4),
+    ('size', '<f4'),
+])
+
+
+def trajectory_path(output_path):
+    """Trajectory file written next to a video, e.g. rare_celebration.sdzt"""
+    return os.path.splitext(output_path)[0] + '.sdzt'
+
+
+def write_trajectories(path, start, end, colors, sizes, duration, width, height,
+                       easing='linear', fade='linear'):
+    """Pack particle trajectories into path and return its size in bytes
+
+    colors are float RGB or RGBA rows in 0..1; sizes are diameters.
+    """
+    start = np.asarray(start, dtype=np.float32).reshape(-1, 2)
+    records = np.zeros(len(start), dtype=RECORD)
+    records['start'] = start
+    records['end'] = np.asarray(end, dtype=np.float32).reshape(-1, 2)
+    colors = np.asarray(colors, dtype=np.float32)
+    # An empty color list has no channel axis to infer; zero-particle scenes are valid
+    colors = colors.reshape(len(start), colors.shape[-1] if colors.ndim == 2 else 3)
+    records['color'][:, :colors.shape[1]] = colors
+    if colors.shape[1] == 3:
+        records['color'][:, 3] = 1.0
+    records['size'] = sizes
+    header = HEADER.pack(MAGIC, VERSION, 0, len(records), duration, width, height,
+                         EASING_IDS.index(easing), EASING_IDS.index(fade), RECORD.itemsize)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(records.tobytes())
+    return HEADER.size + records.nbytes
+
+
+def read_trajectories(path):
+    """Load a trajectory file into (header dict, structured record array)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    (magic, version, _, count, duration, width, height,
+     easing, fade, record_size) = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize:
+        raise ValueError(f"{path} is not a version {VERSION} trajectory file")
+    header = {
+        'count': count, 'duration': duration, 'width': width, 'height': height,
+        'easing': EASING_IDS[easing], 'fade': EASING_IDS[fade],
+    }
+    return header, np.frombuffer(data, dtype=RECORD, count=count, offset=HEADER.size)
+
+
+def load_time(path, repeats=20):
+    """Best-of-N seconds to read and parse a trajectory file"""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        read_trajectories(path)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def export_trajectories(output_path, start, end, colors, sizes, duration, width, height,
+                        easing='linear', fade='linear'):
+    """Write the trajectory file for a video and print its size and load time"""
+    path = trajectory_path(output_path)
+    size = write_trajectories(path, start, end, colors, sizes, duration, width, height, easing, fade)
+    seconds = load_time(path)
+    print(f"   Trajectories: {os.path.basename(path)} {size / 1024:.1f} KB, "
+          f"load+parse {seconds * 1e6:.0f} µs")
+    return path
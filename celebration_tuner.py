@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Encoder auto-tuner for SwapDotz celebration videos
+Given a per-asset target such as "<= 300 KB and SSIM >= 0.98", runs trial
+encodes of the cached lossless intermediate over a codec x preset grid,
+bisecting CRF for each pair, and keeps the smallest output that meets both
+limits instead of relying on hand-picked CRF/preset values
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import celebration_timing as timing
+from celebration_ffmpeg import CODECS, encoder_args, input_pix_fmt
+from celebration_intermediate import encode_intermediate, ensure_intermediate, read_intermediate
+from celebration_parity import BATCH_FRAMES, batch_ssim, decode_frames
+
+# CRF search range on x264's scale (mapped onto the other encoders)
+CRF_RANGE = (10, 51)
+
+def parse_size(value):
+    """Parse a size budget like '300K', '1.5M' or '200000' into bytes"""
+    value = value.strip().upper().rstrip('B')
+    scale = {'K': 1024, 'M': 1024 * 1024}.get(value[-1:], 1)
+    return int(float(value.rstrip('KM')) * scale)
+
+
+def _over_black(frames):
+    """Composite straight-alpha RGBA frames over black; RGB frames pass through"""
+    frames = np.asarray(frames)
+    if frames.shape[-1] == 3:
+        return frames
+    straight = frames[..., :3].astype(np.uint16) * frames[..., 3:]
+    return ((straight + 127) // 255).astype(np.uint8)
+
+
+def measure_ssim(path, reference, width, height, fps, codec, pix_fmt='rgb24', timeout=60):
+    """Worst-frame SSIM of an encoded file against the lossless intermediate it came from
+
+    Scores only the windows with content, like the parity check, so a clip
+    that is mostly empty background cannot pass on its black borders alone.
+    Returns (minimum, mean) over the per-frame scores.
+    """
+    with timing.stage('tune_ssim', codec=codec):
+        encoded = decode_frames(path, width, height, fps, codec, timeout)
+        scores = []
+        batch = []
+        for index, frame in enumerate(read_intermediate(reference, width, height, pix_fmt)):
+            if index >= len(encoded):
+                break
+            batch.append(frame)
+            if len(batch) == BATCH_FRAMES or index == len(encoded) - 1:
+                start = index + 1 - len(batch)
+                scores.extend(batch_ssim(_over_black(np.stack(batch)), encoded[start:index + 1]))
+                batch = []
+    if not scores:
+        raise ValueError(f"{path}: no frames to compare against {reference}")
+    return float(np.min(scores)), float(np.mean(scores))
+
+
+def _trial(reference, width, height, fps, codec, preset, crf, threads, work_dir, timeout):
+    """Encode one CRF/preset/codec point and measure it; ssim is the worst frame's
+
+    A trial whose encode or measurement fails comes back with an 'error'
+    instead of raising, so one bad configuration cannot abort the search.
+    """
+    pix_fmt = input_pix_fmt(codec)
+    path = os.path.join(work_dir, f"{codec}_{preset}_crf{crf}{CODECS[codec]['ext']}")
+    args = encoder_args(codec, crf=crf, preset=preset, threads=threads)
+    try:
+        result = encode_intermediate(reference, fps, path, args, pix_fmt=pix_fmt, timeout=timeout,
+                                     stage='tune_encode')
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, result.args, stderr=result.stderr)
+        min_ssim, mean_ssim = measure_ssim(path, reference, width, height, fps, codec, pix_fmt, timeout)
+    except (ValueError, subprocess.SubprocessError, OSError) as exc:
+        stderr = (getattr(exc, 'stderr', None) or '').strip()
+        return {'codec': codec, 'preset': preset, 'crf': crf, 'path': path, 'bytes': None, 'ssim': None,
+                'mean_ssim': None, 'error': stderr.splitlines()[-1] if stderr else f"{type(exc).__name__}: {exc}"}
+    return {
+        'codec': codec, 'preset': preset, 'crf': crf, 'path': path,
+        'bytes': os.path.getsize(path),
+        'ssim': round(min_ssim, 5),
+        'mean_ssim': round(mean_ssim, 5),
+    }
+
+
+def _bisect_crf(reference, width, height, fps, codec, preset, max_bytes, min_ssim, crf_range, threads, work_dir,
+                timeout):
+    """Worker entry point: find the highest CRF whose worst frame still meets min_ssim
+
+    SSIM falls and size shrinks as CRF rises, so the highest passing CRF is
+    the smallest file this codec/preset can make at the quality target. The
+    search stops early once a trial misses the quality target while already
+    over the size budget (every lower CRF is larger still) or a trial fails
+    (the other CRFs run the same encoder).
+    """
+    low, high = crf_range
+    trials = []
+    best = None
+    while low <= high:
+        crf = (low + high) // 2
+        trial = _trial(reference, width, height, fps, codec, preset, crf, threads, work_dir, timeout)
+        trials.append(trial)
+        if 'error' in trial:
+            break
+        if trial['ssim'] >= min_ssim:
+            best = trial
+            low = crf + 1
+        elif trial['bytes'] > max_bytes:
+            break
+        else:
+            high = crf - 1
+    if best is not None:
+        best = dict(best, fits=best['bytes'] <= max_bytes)
+    return best, trials
+
+
+def tune_encoder(renderer, frame_count, fps, output_path, max_bytes, min_ssim, codecs=('h264',),
+                 presets=('fast',), crf_range=CRF_RANGE, frame_cache=None, threads=None, workers=None,
+                 timeout=60, observe=None):
+    """Pick the smallest codec/preset/CRF that meets a size budget and SSIM target
+
+    The SSIM target applies to every frame's content windows, not to the
+    whole-clip average.
+
+    Every codec/preset pair bisects CRF against the same lossless
+    intermediate, in parallel on up to workers processes (default: one per
+    core; with one, the searches run in this process). Codecs whose
+    container differs from output_path's are skipped. The winning trial is
+    copied to output_path, and the search is recorded as a 'tune' timing
+    stage. observe, if given, sees the winning codec's intermediate frame
+    by frame. Returns a CompletedProcess; returncode 1 means nothing met the
+    target.
+    """
+    ext = os.path.splitext(output_path)[1]
+    codecs = [codec for codec in codecs if CODECS[codec]['ext'] == ext and CODECS[codec].get('decoder') != 'pillow']
+    work_dir = tempfile.mkdtemp(prefix="celebration_tune_")
+    try:
+        with timing.stage('tune', max_bytes=max_bytes, min_ssim=min_ssim) as record:
+            references = {}
+            for codec in codecs:
+                pix_fmt = input_pix_fmt(codec)
+                if pix_fmt not in references:
+                    references[pix_fmt] = ensure_intermediate(renderer, frame_count, fps, frame_cache or work_dir,
+                                                              pix_fmt=pix_fmt, timeout=timeout)
+            grid = [(codec, preset) for codec in codecs for preset in presets]
+            searches = [(references[input_pix_fmt(codec)], renderer.width, renderer.height, fps, codec, preset,
+                         max_bytes, min_ssim, crf_range, threads, work_dir, timeout) for codec, preset in grid]
+            workers = min(len(grid), workers or os.cpu_count() or 1)
+            if workers <= 1:
+                searches = [_bisect_crf(*search) for search in searches]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    searches = list(pool.map(_bisect_crf, *zip(*searches)))
+
+            trials = [trial for _, search in searches for trial in search]
+            candidates = [best for best, _ in searches if best is not None and best['fits']]
+            record['trials'] = [{key: value for key, value in trial.items() if key != 'path'} for trial in trials]
+            if not candidates:
+                record['chosen'] = None
+                print(f"   Tuner: nothing in {len(trials)} trials meets {max_bytes / 1024:.0f} KB "
+                      f"and SSIM {min_ssim}")
+                return subprocess.CompletedProcess([], 1, None, "no encoder configuration meets the target")
+            chosen = min(candidates, key=lambda trial: trial['bytes'])
+            shutil.copyfile(chosen['path'], output_path)
+            if observe is not None:
+                reference = references[input_pix_fmt(chosen['codec'])]
+                for frame in read_intermediate(reference, renderer.width, renderer.height,
+                                               input_pix_fmt(chosen['codec'])):
+                    observe(frame)
+            record['chosen'] = {key: value for key, value in chosen.items() if key != 'path'}
+        print(f"   Tuner: {chosen['codec']} {chosen['preset']} CRF {chosen['crf']} -> "
+              f"{chosen['bytes'] / 1024:.1f} KB, SSIM min {chosen['ssim']:.4f} (mean {chosen['mean_ssim']:.4f}, "
+              f"{len(trials)} trials)")
+        return subprocess.CompletedProcess([], 0, None, '')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Variable-frame-rate output for SwapDotz celebration videos
+Measures how much each rendered frame differs from the last kept one and
+drops near-duplicates (mostly the slow fade-out tail), so the encoder only
+spends bits on frames that change; the kept frames keep their timestamps
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+import celebration_timing as timing
+from celebration_ffmpeg import decode_time, fps_mode_args
+from celebration_frames import TILE_SIZE, tap_frames
+from celebration_intermediate import encode_intermediate, ensure_intermediate, read_intermediate
+
+
+def frame_delta(frame, reference, tile=TILE_SIZE):
+    """Largest per-tile mean absolute difference between two frames, in 8-bit levels
+
+    Taking the worst tile rather than the whole-frame mean keeps a few
+    small moving particles from vanishing into a mostly static frame.
+    """
+    # max - min stays in uint8, avoiding a signed copy of both frames
+    diff = (np.maximum(frame, reference) - np.minimum(frame, reference)).sum(axis=2, dtype=np.int32)
+    rows = np.arange(0, diff.shape[0], tile)
+    cols = np.arange(0, diff.shape[1], tile)
+    sums = np.add.reduceat(np.add.reduceat(diff, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(rows, append=diff.shape[0]), np.diff(cols, append=diff.shape[1]))
+    return float((sums / (counts * frame.shape[2])).max())
+
+
+def select_frames(frames, threshold):
+    """Indices of frames worth keeping
+
+    A frame is kept when frame_delta against the last kept frame exceeds
+    threshold. Comparing against the last kept frame (not the previous
+    one) stops slow drifts from being dropped frame after frame. The first
+    and last frames are always kept so the clip keeps its length.
+    """
+    kept = []
+    reference = None
+    index = -1
+    for index, frame in enumerate(frames):
+        frame = np.asarray(frame, dtype=np.uint8)
+        if reference is None or frame_delta(frame, reference) > threshold:
+            kept.append(index)
+            reference = frame
+    if kept and kept[-1] != index:
+        kept.append(index)
+    return kept
+
+
+def select_expression(kept):
+    """ffmpeg select expression keeping the given frame numbers as ranges"""
+    runs = []
+    for index in kept:
+        if runs and index == runs[-1][1] + 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    return "+".join(f"between(n,{start},{stop})" for start, stop in runs)
+
+
+def vfr_filter_args(kept, codec='h264'):
+    """Flags that keep only the selected frames, at their original timestamps"""
+    args = ['-vf', f"select='{select_expression(kept)}'", *fps_mode_args('vfr')]
+    if codec in ('h264', 'hevc'):
+        # With B-frame reordering over timestamp gaps the MP4 muxer writes a
+        # duration that ends before the last frame
+        args += ['-bf', '0']
+    return args
+
+
+def encode_vfr(renderer, frame_count, fps, output_path, output_args, codec='h264', pix_fmt='rgb24',
+               threshold=0.5, frame_cache=None, timeout=60, compare=True, observe=None):
+    """Encode only frames that differ by more than threshold into a VFR output
+
+    Frames come from the lossless intermediate (a temporary one without a
+    frame_cache). When no frame can be dropped the constant-rate encode is
+    written instead, since the VFR flags (no B-frames) would only cost
+    bytes. With compare=True the constant-rate encode is made too and
+    shipped whenever the VFR file comes out larger; sizes and decode times
+    are printed and recorded as a 'vfr' timing stage, with 'shipped' naming
+    the encode written to output_path. observe sees every frame once, as
+    they are read to find the duplicates. Returns the CompletedProcess of
+    the shipped encode.
+    """
+    work_dir = tempfile.mkdtemp(prefix="celebration_vfr_")
+    try:
+        path = ensure_intermediate(renderer, frame_count, fps, frame_cache or work_dir, pix_fmt=pix_fmt,
+                                   timeout=timeout)
+        with timing.stage('frame_deltas') as record:
+            frames = tap_frames(read_intermediate(path, renderer.width, renderer.height, pix_fmt), observe)
+            kept = select_frames(frames, threshold)
+            record.update(frames=frame_count, kept=len(kept))
+        if len(kept) == frame_count:
+            result = encode_intermediate(path, fps, output_path, output_args, pix_fmt=pix_fmt, timeout=timeout,
+                                         stage='encode_cfr')
+            if result.returncode == 0 and compare:
+                _record_comparison(frame_count, kept, threshold, output_path, output_path, 'cfr', codec, timeout)
+            return result
+
+        result = encode_intermediate(path, fps, output_path, output_args, pix_fmt=pix_fmt, timeout=timeout,
+                                     filter_args=vfr_filter_args(kept, codec))
+        if result.returncode != 0 or not compare:
+            return result
+
+        cfr_path = os.path.join(work_dir, "cfr" + os.path.splitext(output_path)[1])
+        cfr = encode_intermediate(path, fps, cfr_path, output_args, pix_fmt=pix_fmt, timeout=timeout,
+                                  stage='encode_cfr')
+        if cfr.returncode != 0:
+            return result
+        shipped = 'vfr' if os.path.getsize(output_path) < os.path.getsize(cfr_path) else 'cfr'
+        _record_comparison(frame_count, kept, threshold, output_path, cfr_path, shipped, codec, timeout)
+        if shipped == 'cfr':
+            shutil.copyfile(cfr_path, output_path)
+            return cfr
+        return result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _record_comparison(frame_count, kept, threshold, vfr_path, cfr_path, shipped, codec, timeout):
+    """Record and print the VFR vs constant-rate sizes and decode times"""
+    with timing.stage('vfr') as record:
+        try:
+            record.update(
+                frames=frame_count, kept=len(kept), threshold=threshold, shipped=shipped,
+                vfr_bytes=os.path.getsize(vfr_path), cfr_bytes=os.path.getsize(cfr_path),
+                vfr_decode_time=round(decode_time(vfr_path, codec, timeout), 4),
+                cfr_decode_time=round(decode_time(cfr_path, codec, timeout), 4),
+            )
+        except (subprocess.SubprocessError, FileNotFoundError):
+            pass  # the output itself is fine; only the comparison failed
+    if 'vfr_bytes' not in record:
+        return
+    if vfr_path == cfr_path:
+        print(f"   VFR: no frame under threshold {threshold}, wrote the constant-rate encode")
+    else:
+        print(f"   VFR: kept {len(kept)}/{frame_count} frames, "
+              f"{record['vfr_bytes'] / 1024:.1f} KB vs {record['cfr_bytes'] / 1024:.1f} KB, "
+              f"decode {record['vfr_decode_time'] * 1000:.1f} ms vs {record['cfr_decode_time'] * 1000:.1f} ms"
+              f"{', wrote the smaller constant-rate encode' if shipped == 'cfr' else ''}")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Port of Dart's math.Random (Dart VM, as used by Flutter on Android and iOS)
+so Python renders reproduce the app's CustomPainters
+Follows the VM's seed mix and multiply-with-carry step; agreement with the
+VM rests on `flutter test test/dart_random_test.dart`, which replays the
+known answers below against the real math.Random
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+# Values the port records for test/dart_random_test.dart, which checks them
+# against the Dart VM's own math.Random; zero, negative and large seeds
+# cover the seed mix's wraparound
+KNOWN_ANSWERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test',
+                                  'dart_random_known_answers.json')
+KNOWN_ANSWER_SEEDS = (42, 0, 1, 7, 1000, -42, (1 << 31) + 5, (1 << 40) + 3, (1 << 62) + 11)
+KNOWN_ANSWER_COUNT = 8
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+# Multiply-with-carry multiplier from the Dart VM (runtime/lib/math.cc)
+_A = np.uint64(0xFFFFDA61)
+_POW2_27 = float(1 << 27)
+_POW2_53 = float(1 << 53)
+
+
+def _mix64(n):
+    """Thomas Wang's 64-bit mix, used by the VM to spread the seed bits"""
+    n = (~n) + (n << np.uint64(21))
+    n = n ^ (n >> np.uint64(24))
+    n = n * np.uint64(265)
+    n = n ^ (n >> np.uint64(14))
+    n = n * np.uint64(21)
+    n = n ^ (n >> np.uint64(28))
+    n = n + (n << np.uint64(31))
+    return n
+
+
+class DartRandom:
+    """Dart's math.Random(seed), vectorized over any number of seeds
+
+    Each draw advances every seed's stream in lockstep, so one call yields
+    the same values Dart would produce for each seed individually.
+    """
+
+    def __init__(self, seeds):
+        seeds = np.atleast_1d(np.asarray(seeds, dtype=np.int64))
+        with np.errstate(over='ignore'):
+            state = _mix64(seeds.astype(np.uint64))
+        state[state == 0] = np.uint64(0x5A17)
+        self._lo = state & _MASK32
+        self._hi = state >> np.uint64(32)
+        # The Dart factory cranks the generator four times after seeding
+        for _ in range(4):
+            self._next_state()
+
+    def _next_state(self):
+        # A * lo + hi always fits in 64 bits, so no overflow handling is needed
+        state = _A * self._lo + self._hi
+        self._lo = state & _MASK32
+        self._hi = state >> np.uint64(32)
+
+    def next_bits(self, bits):
+        """nextInt(1 << bits): the low bits of the next state"""
+        self._next_state()
+        return self._lo & np.uint64((1 << bits) - 1)
+
+    def next_double(self):
+        """nextDouble(): 53 random bits built from a 26-bit and a 27-bit draw"""
+        high = self.next_bits(26).astype(np.float64)
+        low = self.next_bits(27).astype(np.float64)
+        return (high * _POW2_27 + low) / _POW2_53
+
+    def next_doubles(self, count):
+        """count consecutive nextDouble() values, shaped (seeds, count)"""
+        out = np.empty((self._lo.size, count), dtype=np.float64)
+        for index in range(count):
+            out[:, index] = self.next_double()
+        return out
+
+
+def confetti_draws(count, seeds=42):
+    """Random draws made by _ConfettiPainter for `count` particles
+
+    Returns 'angle' (radians), 'radius' (0..1 share of the max radius),
+    'color' (Color.lerp t) and 'size' (circle radius in logical pixels),
+    each shaped (count,) for a single seed or (seeds, count) for a list.
+    """
+    doubles = DartRandom(seeds).next_doubles(4 * count)
+    # An explicit seed axis, since -1 cannot be inferred when count is 0
+    doubles = doubles.reshape(len(doubles), count, 4)
+    draws = {
+        'angle': doubles[..., 0] * 2 * np.pi,
+        'radius': doubles[..., 1],
+        'color': doubles[..., 2],
+        'size': 2 + doubles[..., 3] * 3,
+    }
+    if np.ndim(seeds) == 0:
+        draws = {key: value[0] for key, value in draws.items()}
+    return draws
+
+
+def known_answers(seeds=KNOWN_ANSWER_SEEDS, count=KNOWN_ANSWER_COUNT):
+    """The first count nextDouble() values of Random(seed) for each seed, keyed by seed"""
+    doubles = DartRandom(list(seeds)).next_doubles(count)
+    return {str(seed): [float(value) for value in row] for seed, row in zip(seeds, doubles)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the Dart Random port against its known answers")
+    parser.add_argument("--write", action="store_true",
+                        help=f"Record the port's values in {os.path.relpath(KNOWN_ANSWERS_FILE)}")
+    args = parser.parse_args()
+
+    answers = {'next_double': known_answers()}
+    if args.write:
+        with open(KNOWN_ANSWERS_FILE, 'w') as f:
+            json.dump(answers, f, indent=2)
+            f.write('\n')
+        print(f"Known answers written to: {KNOWN_ANSWERS_FILE}")
+        print("Run `flutter test test/dart_random_test.dart` to check them against Dart")
+        return True
+    with open(KNOWN_ANSWERS_FILE) as f:
+        recorded = json.load(f)
+    if recorded != answers:
+        changed = [seed for seed in answers['next_double']
+                   if recorded['next_double'].get(seed) != answers['next_double'][seed]]
+        print(f"❌ Port no longer reproduces the recorded answers for seeds {', '.join(changed)}")
+        return False
+    print(f"✅ Port matches {len(answers['next_double'])} recorded seeds")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -3,161 +3,223 @@
 Generate better celebration MP4 videos with more dramatic effects
 """
 
+import argparse
 import subprocess
 import os
-import math
-import random
 
-def create_dramatic_celebration_video(rarity, output_path):
-    """Create celebration video with more dramatic and visible effects"""
-    
-    # Video specifications
-    duration = 2.0  # seconds
-    fps = 30
-    width, height = 720, 1280
-    
-    # Rarity-specific effects
-    if rarity == 'common':
-        bg_color = '#1a1a2e'
-        primary_color = '#32CD32'  # Green
-        secondary_color = '#90EE90'
-        particle_count = 50
-        particle_size = 12
-        speed_multiplier = 1.0
-    elif rarity == 'uncommon':
-        bg_color = '#1a1a2e'
-        primary_color = '#4A90E2'  # Blue
-        secondary_color = '#00CED1'
-        particle_count = 100
-        particle_size = 16
-        speed_multiplier = 1.5
-    else:  # rare
-        bg_color = '#1a1a2e'
-        primary_color = '#FF6B35'  # Orange
-        secondary_color = '#FFD700'
-        particle_count = 150
-        particle_size = 20
-        speed_multiplier = 2.0
-    
-    # Generate particles with dramatic movement
-    particles = []
-    center_x, center_y = width // 2, height // 3
-    
-    for i in range(particle_count):
-        # Random starting position near center
-        start_x = center_x + random.randint(-100, 100)
-        start_y = center_y + random.randint(-50, 50)
-        
-        # Explosive outward movement
-        angle = random.uniform(0, 2 * math.pi)
-        distance = random.uniform(200, 400) * speed_multiplier
-        end_x = start_x + math.cos(angle) * distance
-        end_y = start_y + math.sin(angle) * distance
-        
-        # Keep within bounds
-        end_x = max(0, min(width, end_x))
-        end_y = max(0, min(height, end_y))
-        
-        color = primary_color if i % 3 != 0 else secondary_color
-        size = particle_size + random.randint(-4, 4)
-        
-        particles.append({
-            'start_x': start_x,
-            'start_y': start_y,
-            'end_x': end_x,
-            'end_y': end_y,
-            'color': color,
-            'size': size
-        })
+import numpy as np
+
+from celebration_audio import report_mux, sound_digest
+from celebration_cache import cached_render, render_key
+from celebration_farm import add_farm_arguments, run_farm
+from celebration_ffmpeg import encode_ladder, encode_renderer, ladder_output_path
+from celebration_frames import FrameRenderer, hex_to_rgb
+from celebration_job import job_output_args, option_problem, render_size, write_side_outputs
+from celebration_keyframes import particle_track
+from celebration_presets import add_effects, effect_tables, memoize_tables, preset_rarities, rarity_preset
+from dart_random import DartRandom
+
+def dramatic_particles(rarity, width, height, seeds=42, presets=None):
+    """Particle arrays for one seed, or for a list of seeds in one vectorized block
+
+    Every seed draws from its own Dart-compatible Random stream, so a seed
+    gives the same particles whether it is generated alone or in a batch.
+    Returns 'start' and 'end' (N, 2), 'sizes' (N,) and 'colors' (N hex
+    strings), with a leading seed axis on the arrays for a list of seeds.
+    The rarity's count, colors, sizes and speed come from its 'dramatic'
+    preset.
+    """
+    return _draw_particles(rarity_preset('dramatic', rarity, presets), width, height, seeds)
+
+
+def _draw_particles(preset, width, height, seeds):
+    """dramatic_particles for a resolved preset"""
+    count = preset['particles']
+    draws = DartRandom(seeds).next_doubles(5 * count)
+    draws = draws.reshape(len(draws), count, 5)
+    center = np.float64([width // 2, height // 3])
     
-    # Create FFmpeg filter with dramatic particle animations
-    filters = []
+    # Random starting position near center: +-100px across, +-50px down
+    offsets = np.floor(draws[..., :2] * [201, 101]) - [100, 50]
+    start = center + offsets
     
-    # Base background
-    filters.append(f"color=c={bg_color}:s={width}x{height}:d={duration}:r={fps}[bg]")
+    # Explosive outward movement, kept within bounds
+    angle = draws[..., 2] * 2 * np.pi
+    distance = (200 + draws[..., 3] * 200) * preset['speed']
+    end = start + np.stack([np.cos(angle), np.sin(angle)], axis=-1) * distance[..., None]
+    end = np.clip(end, 0, [width, height])
     
-    # Create particles with movement
-    for i, particle in enumerate(particles):
-        # Create particle
-        filters.append(f"color=c={particle['color']}:s={particle['size']}x{particle['size']}:d={duration}:r={fps}[p{i}]")
-        
-        # Animate position with easing
-        x_expr = f"{particle['start_x']}+({particle['end_x']}-{particle['start_x']})*easeout(t/{duration})"
-        y_expr = f"{particle['start_y']}+({particle['end_y']}-{particle['start_y']})*easeout(t/{duration})"
-        
-        # Animate opacity (fade out)
-        alpha_expr = f"1-t/{duration}"
-        
-        if i == 0:
-            input_name = "bg"
-        else:
-            input_name = f"tmp{i-1}"
-            
-        overlay_filter = f"[{input_name}][p{i}]overlay=x='{x_expr}':y='{y_expr}':alpha='{alpha_expr}':eval=frame[tmp{i}]"
-        filters.append(overlay_filter)
+    # Whole-pixel diameters across the preset's size range
+    min_size, max_size = preset['size']
+    sizes = min_size + np.floor(draws[..., 4] * (int(max_size - min_size) + 1))
+    primary, secondary = preset['colors']
+    colors = [primary if i % 3 != 0 else secondary for i in range(count)]
+    particles = {'start': start.astype(np.float32), 'end': end.astype(np.float32),
+                 'sizes': sizes.astype(np.float32), 'colors': colors}
+    if np.ndim(seeds) == 0:
+        particles.update({key: particles[key][0] for key in ('start', 'end', 'sizes')})
+    return particles
+
+
+def dramatic_scene(rarity, width=720, height=1280, seed=42, fps=30, particles=None, presets=None):
+    """Particles plus keyframe tables for one rarity's dramatic clip
+
+    particles takes precomputed dramatic_particles arrays for this seed and
+    size. Scenes drawn from a seed are memoized per preset, size, seed and
+    frame rate, and their arrays are read-only.
+    """
+    preset = rarity_preset('dramatic', rarity, presets)
+    if particles is None:
+        return _seeded_scene(preset, width, height, seed, fps)
+    return _build_scene(preset, width, height, fps, particles)
+
+
+def _build_scene(preset, width, height, fps, particles):
+    """dramatic_scene for a resolved preset and its particle arrays"""
+    # Precompute per-frame positions (eased) and opacity (faded) as keyframe
+    # tables for the NumPy compositor
+    duration = preset['duration']
+    frame_count = int(round(duration * fps))
+    track = particle_track(particles['start'], particles['end'], duration, fps, easing=preset['easing'],
+                           fade=preset['fade'])
+    return dict(
+        effect_tables(preset, width, height, fps, frame_count), **particles,
+        width=width, height=height, fps=fps, duration=duration, frame_count=frame_count, track=track,
+        center=(width // 2, height // 3), particle_count=preset['particles'], background=preset['background'],
+        easing=preset['easing'], fade=preset['fade'], effects=preset['effects'],
+    )
+
+
+@memoize_tables
+def _seeded_scene(preset, width, height, seed, fps):
+    return _build_scene(preset, width, height, fps, _draw_particles(preset, width, height, seed))
+
+
+def dramatic_renderer(scene):
+    """FrameRenderer drawing a dramatic_scene: particles, then any effects"""
+    background = scene['background']
+    renderer = FrameRenderer(scene['width'], scene['height'],
+                             bg_color=None if background == 'transparent' else background)
+    if scene['particle_count']:
+        renderer.add_particles(scene['track'], scene['sizes'], [hex_to_rgb(color) for color in scene['colors']])
+    add_effects(renderer, *scene['center'], scene)
+    return renderer
+
+
+def seed_variants(rarity, width, height, seeds, presets=None):
+    """Per-seed create_dramatic_celebration_video kwargs, generated in one block"""
+    particles = dramatic_particles(rarity, width, height, list(seeds), presets)
+    return [{'particles': dict(particles, start=particles['start'][index], end=particles['end'][index],
+                               sizes=particles['sizes'][index])}
+            for index in range(len(seeds))]
+
+
+def create_dramatic_celebration_video(rarity, output_path, width=720, height=1280,
+                                      seed=42, codec='h264', threads=None, cache_dir=None,
+                                      segments=1, fps=30, ladder=None, crf=None, preset=None,
+                                      trajectories=False, poster_at=None, vfr_threshold=None,
+                                      tune=None, audio=None, particles=None, presets=None, workers=None):
+    """Create celebration video with more dramatic and visible effects
+
+    A ladder renders once at its largest tier and writes one file per tier
+    (not cached). trajectories and poster_at write the particle data and a
+    poster once the video rendered. vfr_threshold keeps only frames that
+    change and tune searches for the smallest encoder settings meeting its
+    targets (neither with a ladder); audio muxes the rarity sound in the
+    same pass (no ladder, VFR or tuning). particles takes this seed's
+    precomputed dramatic_particles, presets the preset file; crf and
+    preset override its encoder profile and workers caps the processes a
+    segmented encode may start.
+    """
     
-    # Final output
-    final_output = f"tmp{len(particles)-1}" if particles else "bg"
+    try:
+        style = rarity_preset('dramatic', rarity, presets)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return False
+    problem = option_problem(rarity, output_path, style, ladder=ladder, vfr_threshold=vfr_threshold, tune=tune,
+                             audio=audio)
+    if problem:
+        print(f"❌ {problem}")
+        return False
+    width, height, fps = render_size(width, height, fps, ladder)
+    scene = dramatic_scene(rarity, width, height, seed, fps, particles, presets)
+    start, end, sizes, colors = scene['start'], scene['end'], scene['sizes'], scene['colors']
+    duration, frame_count, particle_count = scene['duration'], scene['frame_count'], scene['particle_count']
+    bg_color = None if scene['background'] == 'transparent' else scene['background']
     
-    # Build complete filter
-    filter_complex = ";".join(filters)
+    output_args = job_output_args(style, codec, fps, crf, preset, threads, audio, frame_count / fps)
+    if audio:
+        segments = 1
+    frame_cache = os.path.join(cache_dir, 'frames') if cache_dir else None
     
-    # FFmpeg command with high quality settings
-    cmd = [
-        'ffmpeg', '-y',
-        '-f', 'lavfi',
-        '-i', f'color=c={bg_color}:s={width}x{height}:d={duration}:r={fps}',
-        '-filter_complex', filter_complex,
-        '-map', f'[{final_output}]',
-        '-c:v', 'libx264',
-        '-pix_fmt', 'yuv420p',
-        '-crf', '15',  # Very high quality
-        '-preset', 'slow',  # Better compression
-        '-movflags', '+faststart',
-        '-r', str(fps),
-        output_path
-    ]
+    # The particle arrays already capture seed, count, colors and sizes
+    key = render_key(
+        generator='dramatic', start=start, end=end, sizes=sizes, colors=colors, easing=scene['easing'],
+        fade=scene['fade'], effects=scene['effects'], bg_color=bg_color, duration=duration,
+        fps=fps, width=width, height=height, encoder=output_args, segments=segments,
+        vfr_threshold=vfr_threshold, tune=tune, sounds=sound_digest(style['sound']) if audio else None,
+    )
     
-    print(f"Generating DRAMATIC {rarity} celebration video with {particle_count} particles...")
+    renderer = dramatic_renderer(scene)
     
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        if result.returncode == 0:
-            print(f"✅ Successfully created {output_path}")
-            file_size = os.path.getsize(output_path) / 1024  # KB
-            print(f"   File size: {file_size:.1f} KB")
-            return True
-        else:
-            print(f"❌ FFmpeg error: {result.stderr}")
+    def render(path):
+        print(f"Generating DRAMATIC {rarity} celebration video with {particle_count} particles...")
+        
+        try:
+            if ladder:
+                result = encode_ladder(renderer, frame_count, fps, ladder, path, codec=codec,
+                                       output_args=output_args, timeout=120)
+            else:
+                result = encode_renderer(renderer, frame_count, width, height, fps, path, codec=codec,
+                                         output_args=output_args, segments=segments, timeout=120,
+                                         frame_cache=frame_cache, vfr_threshold=vfr_threshold,
+                                         tune=tune, workers=workers)
+            if result.returncode == 0:
+                print(f"✅ Successfully created {rarity} video")
+                for output in ([ladder_output_path(path, tier) for tier in ladder] if ladder else [path]):
+                    file_size = os.path.getsize(output) / 1024  # KB
+                    print(f"   File size: {file_size:.1f} KB ({os.path.basename(output)})")
+                if audio:
+                    report_mux(path, style['sound'])
+                return True
+            else:
+                print(f"❌ FFmpeg error: {result.stderr}")
+                return False
+        except subprocess.TimeoutExpired:
+            print(f"❌ Timeout generating {rarity} video")
             return False
-    except subprocess.TimeoutExpired:
-        print(f"❌ Timeout generating {rarity} video")
-        return False
-    except FileNotFoundError:
-        print("❌ FFmpeg not found. Please install FFmpeg first.")
+        except FileNotFoundError:
+            print("❌ FFmpeg not found. Please install FFmpeg first.")
+            return False
+    
+    if not cached_render(key, output_path, None if ladder else cache_dir, render):
         return False
+    write_side_outputs(output_path, scene, renderer, trajectories, poster_at)
+    return True
 
 def main():
-    output_dir = "/home/oliver/Desktop/swapdotz_flutter/assets/celebration_videos"
-    os.makedirs(output_dir, exist_ok=True)
+    parser = argparse.ArgumentParser(description="Generate dramatic SwapDotz celebration videos")
+    parser.add_argument("--output-dir", default="/home/oliver/Desktop/swapdotz_flutter/assets/celebration_videos",
+                        help="Directory for the generated videos")
+    add_farm_arguments(parser, default_seed=42)
+    args = parser.parse_args()
     
-    rarities = ['common', 'uncommon', 'rare']
+    success = run_farm(create_dramatic_celebration_video, args, generator='dramatic', variants=seed_variants)
     
-    for rarity in rarities:
-        output_path = os.path.join(output_dir, f"{rarity}_celebration.mp4")
-        success = create_dramatic_celebration_video(rarity, output_path)
-        
-        if not success:
-            print(f"Failed to create {rarity} video")
-            return False
+    if not success:
+        print("Some DRAMATIC celebration videos failed to render")
+        return False
     
     print("\n🎉 All DRAMATIC celebration videos generated successfully!")
-    print("These videos feature:")
-    print("- Large, visible particles (12-20px)")
-    print("- Explosive outward movement")
-    print("- Rarity-specific colors and particle counts")
-    print("- High quality encoding (CRF 15)")
+    print("These videos feature (from the dramatic presets):")
+    for rarity in args.rarities or preset_rarities('dramatic', args.presets):
+        style = rarity_preset('dramatic', rarity, args.presets)
+        encoder = style['encoder']
+        crf = encoder['crf'] if args.crf is None else args.crf
+        print(f"- {rarity}: {style['particles']} particles ({style['size'][0]:g}-{style['size'][1]:g}px), "
+              f"speed {style['speed']:g}x, CRF {crf} {args.preset or encoder['preset']}")
     return True
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
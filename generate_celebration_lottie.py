@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Export SwapDotz celebration animations as Lottie (bodymovin) JSON
+Uses the same particles, rays, shockwave and keyframe tables as the MP4 renderer and
+compares the vector file size against the rendered videos
+"""
+
+import argparse
+import gzip
+import json
+import os
+
+import numpy as np
+
+from celebration_presets import preset_rarities
+from celebration_frames import hex_to_rgb
+from generate_celebration_videos import celebration_scene
+
+LOTTIE_VERSION = '5.7.4'
+
+
+def _keyframe_rows(values, tolerance=0.01):
+    """Frame indices needed to rebuild a keyframe table with linear segments
+
+    Greedily extends each segment while every skipped frame stays within
+    tolerance of the straight line, so linear tracks collapse to two keys.
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(len(values), -1)
+    rows = [0]
+    anchor = 0
+    for index in range(2, len(values)):
+        span = np.arange(anchor + 1, index)
+        share = ((span - anchor) / (index - anchor))[:, None]
+        line = values[anchor] + (values[index] - values[anchor]) * share
+        if np.abs(line - values[span]).max() > tolerance:
+            anchor = index - 1
+            rows.append(anchor)
+    if len(values) > 1:
+        rows.append(len(values) - 1)
+    return rows
+
+
+def _round(values, digits=2):
+    """Round for compact JSON, returning plain Python numbers"""
+    return np.round(np.asarray(values, dtype=np.float64), digits).tolist()
+
+
+def _static(value):
+    return {'a': 0, 'k': value}
+
+
+def _animated(values, tolerance=0.01):
+    """Linear Lottie keyframes for a per-frame table (F,) or (F, D)"""
+    values = np.asarray(values, dtype=np.float64)
+    rows = _keyframe_rows(values, tolerance)
+    if len(rows) == 1 or np.all(values == values[0]):
+        return _static(_round(values[0]))
+    linear = {'i': {'x': [1], 'y': [1]}, 'o': {'x': [0], 'y': [0]}}
+    keys = [dict(linear, t=row, s=_round(np.atleast_1d(values[row]))) for row in rows[:-1]]
+    keys.append({'t': rows[-1], 's': _round(np.atleast_1d(values[rows[-1]]))})
+    return {'a': 1, 'k': keys}
+
+
+def _transform(position=None, opacity=None):
+    """Shape-group transform; position and opacity may be animated"""
+    return {
+        'ty': 'tr',
+        'p': position or _static([0, 0]),
+        'a': _static([0, 0]),
+        's': _static([100, 100]),
+        'r': _static(0),
+        'o': opacity or _static(100),
+    }
+
+
+def _layer(index, name, shapes, frame_count, opacity):
+    """Full-canvas shape layer with an animated layer opacity"""
+    return {
+        'ddd': 0, 'ind': index, 'ty': 4, 'nm': name, 'sr': 1,
+        'ks': {
+            'o': opacity,
+            'r': _static(0),
+            'p': _static([0, 0, 0]),
+            'a': _static([0, 0, 0]),
+            's': _static([100, 100, 100]),
+        },
+        'ao': 0, 'shapes': shapes, 'ip': 0, 'op': frame_count, 'st': 0, 'bm': 0,
+    }
+
+
+def _color(color):
+    return _static(_round(np.append(hex_to_rgb(color), 1.0), 4))
+
+
+def confetti_layer(scene, index):
+    """One circle group per particle, moving along the confetti table"""
+    track = scene['confetti']
+    groups = []
+    for particle, (size, color) in enumerate(zip(scene['sizes'], scene['colors'])):
+        groups.append({
+            'ty': 'gr', 'nm': f"p{particle}",
+            'it': [
+                {'ty': 'el', 'p': _static([0, 0]), 's': _static(_round([size, size]))},
+                {'ty': 'fl', 'c': _color(color), 'o': _static(100), 'r': 1},
+                _transform(position=_animated(track['positions'][:, particle])),
+            ],
+        })
+    opacity = _animated(track['alpha'] * 100)
+    return _layer(index, 'confetti', groups, scene['frame_count'], opacity)
+
+
+def rays_layer(scene, index):
+    """Burst rays as open paths revealed by one trim-paths modifier"""
+    rays, color = scene['rays'], scene['ray_color']
+    center_x, center_y = scene['center']
+    ray_count, ray_length = scene['ray_count'], scene['ray_length']
+    angles = (2 * np.pi / ray_count) * np.arange(ray_count)
+    paths = [{
+        'ty': 'sh', 'nm': f"ray{ray}",
+        'ks': _static({
+            'c': False,
+            'v': [[0, 0], _round([np.cos(angle) * ray_length, np.sin(angle) * ray_length])],
+            'i': [[0, 0], [0, 0]],
+            'o': [[0, 0], [0, 0]],
+        }),
+    } for ray, angle in enumerate(angles)]
+    # Ray length grows along the table; trimming every path at once (m=1,
+    # simultaneously) reproduces it, where m=2 would trim the rays one by one
+    trim_end = rays['length'] / ray_length * 100 if ray_length else np.zeros_like(rays['length'])
+    group = {
+        'ty': 'gr', 'nm': 'burst',
+        'it': paths + [
+            {'ty': 'st', 'c': _color(color), 'o': _static(100), 'w': _static(scene['ray_stroke']), 'lc': 2,
+             'lj': 2},
+            {'ty': 'tm', 's': _static(0), 'e': _animated(trim_end), 'o': _static(0), 'm': 1},
+            _transform(position=_static(_round([center_x, center_y]))),
+        ],
+    }
+    return _layer(index, 'burst_rays', [group], scene['frame_count'], _animated(rays['alpha'] * 100))
+
+
+def shockwave_layer(scene, index):
+    """Expanding stroked circle keyed from the shockwave ring table"""
+    ring, color = scene['shockwave'], scene['shockwave_color']
+    diameter = np.repeat(ring['radius'][:, None] * 2, 2, axis=1)
+    group = {
+        'ty': 'gr', 'nm': 'ring',
+        'it': [
+            {'ty': 'el', 'p': _static([0, 0]), 's': _animated(diameter, tolerance=0.25)},
+            {'ty': 'st', 'c': _color(color), 'o': _static(100), 'w': _animated(ring['stroke'], tolerance=0.05),
+             'lc': 2, 'lj': 2},
+            _transform(position=_static(_round(scene['center']))),
+        ],
+    }
+    return _layer(index, 'shockwave', [group], scene['frame_count'], _animated(ring['alpha'] * 100, tolerance=0.5))
+
+
+def lottie_animation(scene):
+    """Build the bodymovin document for a celebration_scene"""
+    # Lottie lists layers top-most first; Flutter paints confetti, rays, shockwave
+    layers = []
+    if scene['shockwave'] is not None:
+        layers.append(shockwave_layer(scene, len(layers) + 1))
+    if scene['ray_count']:
+        layers.append(rays_layer(scene, len(layers) + 1))
+    if scene['sizes']:
+        layers.append(confetti_layer(scene, len(layers) + 1))
+    return {
+        'v': LOTTIE_VERSION,
+        'nm': f"{scene['rarity']}_celebration",
+        'fr': scene['fps'],
+        'ip': 0,
+        'op': scene['frame_count'],
+        'w': scene['width'],
+        'h': scene['height'],
+        'ddd': 0,
+        'assets': [],
+        'layers': layers,
+    }
+
+
+def export_lottie(rarity, output_path, width=720, height=1280, seed=42, fps=30, presets=None):
+    """Write the Lottie JSON for one rarity and return its size in bytes"""
+    scene = celebration_scene(rarity, width, height, seed, fps=fps, presets=presets)
+    payload = json.dumps(lottie_animation(scene), separators=(',', ':'))
+    with open(output_path, 'w') as f:
+        f.write(payload)
+    return len(payload.encode())
+
+
+def print_size_comparison(rows):
+    """Print Lottie (raw and gzipped) against the matching video files"""
+    print("\nSize comparison:")
+    print(f"   {'rarity':10s} {'lottie':>10s} {'lottie.gz':>10s} {'video':>10s} {'ratio':>7s}")
+    for row in rows:
+        video = f"{row['video_bytes'] / 1024:8.1f}KB" if row['video_bytes'] else f"{'-':>10s}"
+        ratio = f"{row['video_bytes'] / row['lottie_bytes']:6.1f}x" if row['video_bytes'] else f"{'-':>7s}"
+        print(f"   {row['rarity']:10s} {row['lottie_bytes'] / 1024:8.1f}KB "
+              f"{row['gzip_bytes'] / 1024:8.1f}KB {video} {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export SwapDotz celebrations as Lottie JSON")
+    parser.add_argument("--output-dir", default="/home/oliver/Desktop/swapdotz_flutter/assets/celebration_videos",
+                        help="Directory for the Lottie files")
+    parser.add_argument("--video-dir", default=None,
+                        help="Directory holding <rarity>_celebration.mp4 to compare against "
+                             "(default: --output-dir)")
+    parser.add_argument("--presets", default=None,
+                        help="Rarity preset file, JSON or TOML (default: celebration_presets.json)")
+    parser.add_argument("--rarities", nargs="+", default=None,
+                        help="Rarities to export (default: every rarity in the preset file)")
+    parser.add_argument("--seed", type=int, default=42, help="Particle seed")
+    parser.add_argument("--width", type=int, default=720)
+    parser.add_argument("--height", type=int, default=1280)
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    video_dir = args.video_dir or args.output_dir
+    rows = []
+    for rarity in args.rarities or preset_rarities('celebration', args.presets):
+        output_path = os.path.join(args.output_dir, f"{rarity}_celebration.json")
+        size = export_lottie(rarity, output_path, args.width, args.height, args.seed, args.fps, args.presets)
+        with open(output_path, 'rb') as f:
+            gzip_bytes = len(gzip.compress(f.read(), 9))
+        video_path = os.path.join(video_dir, f"{rarity}_celebration.mp4")
+        rows.append({
+            'rarity': rarity,
+            'lottie_bytes': size,
+            'gzip_bytes': gzip_bytes,
+            'video_bytes': os.path.getsize(video_path) if os.path.exists(video_path) else 0,
+        })
+        print(f"✅ Exported {output_path}")
+
+    print_size_comparison(rows)
+    return True
+
+
+if __name__ == "__main__":
+    main()
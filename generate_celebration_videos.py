@@ -4,137 +4,349 @@ Generate celebration MP4 videos for SwapDotz app
 Creates rarity-specific celebration animations as MP4 files
 """
 
+import argparse
 import subprocess
 import os
 import math
-import random
-
-def create_celebration_video(rarity, output_path):
-    """Create celebration video matching the exact Flutter animations"""
-    
-    # Video specifications
-    duration = 1.5  # Match Flutter animation duration
-    fps = 30
-    width, height = 720, 1280
-    
-    # Rarity-specific settings matching Flutter code exactly
-    if rarity == 'common':
-        bg_color = 'transparent'  # Transparent background
-        particle_count = 30       # Exact same as Flutter
-        particle_colors = ['#32CD32', '#90EE90']  # Green variants
-        effects = []
-    elif rarity == 'uncommon':
-        bg_color = 'transparent'
-        particle_count = 60       # Exact same as Flutter
-        particle_colors = ['#4A90E2', '#00CED1']  # Blue variants
-        effects = ['burst_rays']  # Add burst rays like Flutter
-    else:  # rare
-        bg_color = 'transparent'
-        particle_count = 100      # Exact same as Flutter  
-        particle_colors = ['#FF6B35', '#FFD700']  # Orange/gold variants
-        effects = ['burst_rays', 'shockwave']  # Full effects like Flutter
+import shutil
+import tempfile
+
+import numpy as np
+
+import celebration_timing as timing
+from celebration_audio import report_mux, sound_digest
+from celebration_cache import cached_render, render_key
+from celebration_farm import add_farm_arguments, run_farm
+from celebration_ffmpeg import encode_ladder, encode_renderer, run_ffmpeg
+from celebration_frames import FrameRenderer, color_lerp, hex_to_rgb
+from celebration_job import job_output_args, option_problem, render_size, write_side_outputs
+from celebration_keyframes import particle_track
+from celebration_parity import ParityScorer
+from celebration_presets import add_effects, effect_tables, memoize_tables, rarity_preset
+from dart_random import confetti_draws
+
+# The legacy filter graph snaps particles to a small palette of lerp colors
+# and to even sizes, so overlays can share one color source per bucket
+GRAPH_PALETTE_COLORS = 4
+GRAPH_SIZE_STEP = 2
+
+
+def celebration_scene(rarity, width=720, height=1280, seed=42, fps=30, draws=None, particle_count=None,
+                      presets=None):
+    """Particle and ray definitions plus keyframe tables for one rarity
+
+    Shared by the video renderers and the Lottie exporter so every output
+    format draws the same particles. The rarity's look comes from its
+    'celebration' preset; draws takes this seed's precomputed
+    confetti_draws and particle_count overrides the preset count
+    (benchmarks). Scenes drawn from a seed are memoized per preset, size,
+    seed and frame rate, and their arrays are read-only.
+    """
+    preset = rarity_preset('celebration', rarity, presets)
+    if particle_count is not None:
+        preset = dict(preset, particles=particle_count)
+    if draws is None:
+        return _seeded_scene(rarity, preset, width, height, seed, fps)
+    return _build_scene(rarity, preset, width, height, fps, draws)
+
+
+def _build_scene(rarity, preset, width, height, fps, draws):
+    """celebration_scene for a preset and this seed's confetti_draws"""
+    shortest_side = min(width, height)
+    duration, particle_colors = preset['duration'], preset['colors']
     
     # Create confetti explosion matching Flutter's _ConfettiPainter
     # This replicates the exact math from Flutter: 
     # - Random angle: rnd.nextDouble() * 2 * math.pi
     # - Radius grows over time: progress * (size.shortestSide * 0.6) * rnd.nextDouble()
     # - Center point: (width/2, height/3)
+    center_x = width / 2       # 360
+    center_y = height / 3      # ~426.7 (matches Flutter height/3)
     
-    filters = []
+    # Flutter calculation: progress * (size.shortestSide * 0.6) * rnd.nextDouble()
+    # size.shortestSide = 720, so max_radius = 720 * 0.6 = 432
+    max_radius = shortest_side * 0.6 * draws['radius']
+    end_xs = center_x + np.cos(draws['angle']) * max_radius
+    end_ys = center_y + np.sin(draws['angle']) * max_radius
     
-    # Base transparent background
-    filters.append(f"color=c=black@0.0:s={width}x{height}:d={duration}:r={fps}[bg]")
+    # drawCircle radius 2 + rnd.nextDouble() * 3 -> 4-10px diameter, spread
+    # over the preset's diameter range
+    min_size, max_size = preset['size']
+    sizes = list(min_size + (max_size - min_size) * (draws['size'] - 2) / 3)
     
-    # Generate particles using same random seed as Flutter (42)
-    random.seed(42)  # Match Flutter's Random(42)
+    # Color.lerp between the preset's two colors with Flutter's lerp draw;
+    # the defaults are the painter's cyanAccent and orangeAccent
+    colors = color_lerp(particle_colors[0], particle_colors[1], draws['color'])
     
-    center_x = width // 2      # 360
-    center_y = height // 3     # ~427 (matches Flutter height/3)
+    # Precompute per-frame keyframe tables once; both renderers read these
+    # instead of evaluating position expressions per frame. Burst rays and
+    # the shockwave follow Flutter's _BurstPainter and _ShockwavePainter
+    frame_count = int(round(duration * fps))
+    start = np.tile(np.float32([center_x, center_y]), (preset['particles'], 1))
+    end = np.column_stack([end_xs, end_ys])
+    confetti = particle_track(start, end, duration, fps, easing=preset['easing'], fade=preset['fade'])
     
-    for i in range(particle_count):
-        # Match Flutter's random generation exactly
-        angle = random.uniform(0, 2 * math.pi)
-        velocity = random.uniform(0.0, 1.0)  # Flutter: rnd.nextDouble()
-        
-        # Flutter calculation: progress * (size.shortestSide * 0.6) * velocity
-        # size.shortestSide = 720, so max_radius = 720 * 0.6 = 432
-        max_radius = 432 * velocity
-        
-        # End position
-        end_x = center_x + math.cos(angle) * max_radius
-        end_y = center_y + math.sin(angle) * max_radius
-        
-        # Particle size (2 + rnd.nextDouble() * 3) -> 2-5px
-        size = 2 + random.uniform(0, 3)
-        
-        # Particle color (alternating like Flutter)
-        color = particle_colors[i % len(particle_colors)]
-        
-        # Create particle
-        particle_size = int(size)
-        filters.append(f"color=c={color}:s={particle_size}x{particle_size}:d={duration}:r={fps}[p{i}]")
-        
-        # Animate position with Flutter's easing (linear progress)
-        x_expr = f"{center_x}+({end_x}-{center_x})*t/{duration}"
-        y_expr = f"{center_y}+({end_y}-{center_y})*t/{duration}"
+    return dict(
+        effect_tables(preset, width, height, fps, frame_count),
+        rarity=rarity, width=width, height=height, duration=duration, fps=fps,
+        frame_count=frame_count, particle_count=preset['particles'], background=preset['background'],
+        particle_colors=particle_colors, effects=preset['effects'], center=(center_x, center_y),
+        start=start, end=end, sizes=sizes, colors=colors, color_t=draws['color'], confetti=confetti,
+        easing=preset['easing'], fade=preset['fade'],
+    )
+
+
+@memoize_tables
+def _seeded_scene(rarity, preset, width, height, seed, fps):
+    # Draw particles from the dart_random port of Dart's Random(seed), in the
+    # same order _ConfettiPainter consumes it: angle, radius, color, size
+    return _build_scene(rarity, preset, width, height, fps, confetti_draws(preset['particles'], seed))
+
+
+def scene_renderer(scene):
+    """FrameRenderer drawing a celebration_scene in Flutter's stack order"""
+    background = scene['background']
+    renderer = FrameRenderer(scene['width'], scene['height'],
+                             bg_color=None if background == 'transparent' else background)
+    center_x, center_y = scene['center']
+    if scene['sizes']:
+        renderer.add_particles(scene['confetti'], scene['sizes'], [hex_to_rgb(color) for color in scene['colors']])
+    add_effects(renderer, center_x, center_y, scene)
+    return renderer
+
+
+def seed_variants(rarity, width, height, seeds, presets=None):
+    """Per-seed create_celebration_video kwargs, drawn in one vectorized block"""
+    draws = confetti_draws(rarity_preset('celebration', rarity, presets)['particles'], list(seeds))
+    return [{'draws': {key: value[index] for key, value in draws.items()}} for index in range(len(seeds))]
+
+
+def create_celebration_video(rarity, output_path, renderer='numpy', width=720, height=1280,
+                             seed=42, codec='h264', threads=None, cache_dir=None,
+                             segments=1, fps=30, ladder=None, crf=None, preset=None, trajectories=False,
+                             poster_at=None, vfr_threshold=None, tune=None, audio=None, draws=None,
+                             particle_count=None, presets=None, workers=None, parity=False):
+    """Create celebration video matching the exact Flutter animations
+
+    renderer='numpy' rasterizes frames in Python and pipes them to one
+    encoder; renderer='ffmpeg' builds the legacy per-particle overlay graph.
+    Ladders, VFR, tuning and audio need the numpy renderer (see
+    option_problem); posters and parity are skipped without it. parity=True
+    scores the encoded frames as a 'parity' timing stage. Unchanged inputs
+    are served from cache_dir.
+    """
+    
+    try:
+        style = rarity_preset('celebration', rarity, presets)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return False
+    problem = option_problem(rarity, output_path, style, renderer, ladder, vfr_threshold, tune, audio)
+    if problem:
+        print(f"❌ {problem}")
+        return False
+    width, height, fps = render_size(width, height, fps, ladder)
+    scene = celebration_scene(rarity, width, height, seed, fps, draws, particle_count, presets)
+    output_args = job_output_args(style, codec, fps, crf, preset, threads, audio, scene['frame_count'] / fps)
+    if audio:
+        segments = 1
+    frame_cache = os.path.join(cache_dir, 'frames') if cache_dir else None
+    duration = scene['duration']
+    particle_count, particle_colors, effects = scene['particle_count'], scene['particle_colors'], scene['effects']
+    end, sizes, colors = scene['end'], scene['sizes'], scene['colors']
+    ray_count = scene['ray_count']
+    frame_count = scene['frame_count']
+    frame_renderer = scene_renderer(scene)
+    
+    # Every input that changes the encoded bytes goes into the cache key
+    key = render_key(
+        generator='celebration', renderer=renderer, particle_count=particle_count,
+        particle_colors=particle_colors, end=end, sizes=sizes, colors=colors, seed=seed,
+        duration=duration, fps=fps, width=width, height=height, effects=effects,
+        easing=scene['easing'], fade=scene['fade'], background=scene['background'],
+        ray_count=ray_count, encoder=output_args, segments=segments, vfr_threshold=vfr_threshold,
+        tune=tune, sounds=sound_digest(style['sound']) if audio else None, parity=parity,
+    )
+    
+    def render(path):
+        print(f"Generating {rarity} celebration video ({renderer} renderer)...")
+        if renderer == 'numpy':
+            scorer = ParityScorer(rarity, width, height, fps) if parity and not ladder else None
+            ok = _render_numpy(rarity, path, frame_renderer, frame_count, fps, codec, output_args, segments,
+                               ladder, frame_cache, vfr_threshold, tune, workers,
+                               observe=scorer.add if scorer else None)
+            # Parallel slices are rendered elsewhere and leave the score short
+            if ok and scorer and scorer.frames == frame_count:
+                report = scorer.report()
+                with timing.stage('parity', **report, score_time=round(scorer.seconds, 3)):
+                    pass
+            if ok and audio:
+                report_mux(path, style['sound'])
+            return ok
+        return _render_filter_graph(rarity, path, scene, output_args)
+    
+    if poster_at is not None and renderer != 'numpy':
+        print(f"   Skipping {rarity} poster: it would not match the {renderer} renderer's frames")
+        poster_at = None
+    
+    if not cached_render(key, output_path, None if ladder else cache_dir, render):
+        return False
+    write_side_outputs(output_path, scene, frame_renderer, trajectories, poster_at)
+    return True
+
+
+def _render_numpy(rarity, output_path, renderer, frame_count, fps, codec, output_args, segments,
+                  ladder=None, frame_cache=None, vfr_threshold=None, tune=None, workers=None, observe=None):
+    """Rasterize every frame with NumPy and pipe it into the encoder
+
+    With segments > 1 the clip is split into GOP-aligned slices that render
+    and encode in parallel before being joined; with a ladder every tier is
+    produced from the same frame stream; a vfr_threshold drops near-duplicate
+    frames and tune searches for the smallest encoder configuration.
+    """
+    width, height = renderer.width, renderer.height
+    try:
+        if ladder:
+            result = encode_ladder(renderer, frame_count, fps, ladder, output_path, codec=codec,
+                                   output_args=output_args)
+        else:
+            result = encode_renderer(renderer, frame_count, width, height, fps, output_path, codec=codec,
+                                     output_args=output_args, segments=segments, frame_cache=frame_cache,
+                                     vfr_threshold=vfr_threshold, tune=tune, workers=workers, observe=observe)
+        if result.returncode == 0:
+            print(f"✅ Successfully created {rarity} video")
+            return True
+        else:
+            print(f"❌ FFmpeg error: {result.stderr}")
+            return False
+    except subprocess.TimeoutExpired:
+        print(f"❌ Timeout generating {rarity} video")
+        return False
+    except FileNotFoundError:
+        print("❌ FFmpeg not found. Please install FFmpeg first:")
+        print("   Ubuntu/Debian: sudo apt install ffmpeg")
+        print("   macOS: brew install ffmpeg")
+        return False
+
+
+def _write_sendcmd_script(path, tracks, fps):
+    """Write per-frame overlay x/y commands for ffmpeg's sendcmd filter
+
+    tracks maps overlay instance names to (frames, 2) position arrays.
+    Returns the number of commands written; sendcmd rejects an empty script.
+    """
+    frame_count = max((len(positions) for positions in tracks.values()), default=0)
+    with open(path, 'w') as f:
+        for index in range(1, frame_count):
+            commands = []
+            for name, positions in tracks.items():
+                x, y = positions[min(index, len(positions) - 1)]
+                commands.append(f"overlay@{name} x {x:.2f}, overlay@{name} y {y:.2f}")
+            f.write(f"{index / fps:.6f} [enter] {', '.join(commands)};\n")
+    return max(frame_count - 1, 0)
+
+
+def _shared_source(source, labels):
+    """One generator feeding every label, through split when there are several"""
+    if len(labels) == 1:
+        return f"{source}[{labels[0]}]"
+    return f"{source},split={len(labels)}" + "".join(f"[{label}]" for label in labels)
+
+
+def _render_filter_graph(rarity, output_path, scene, output_args):
+    """Legacy path: one overlay node per particle and ray, fed by a few shared color sources
+
+    Positions come from the keyframe tables through sendcmd, so overlays
+    evaluate once at init instead of parsing an expression every frame.
+    Particles are drawn in the graph palette (GRAPH_PALETTE_COLORS lerp
+    colors, sizes in GRAPH_SIZE_STEP pixel steps). The shockwave ring is
+    only drawn by the numpy renderer.
+    """
+    confetti, sizes = scene['confetti'], scene['sizes']
+    rays, ray_count = scene['rays'], scene['ray_count']
+    center_x, center_y = scene['center']
+    width, height, duration, fps = scene['width'], scene['height'], scene['duration'], scene['fps']
+    background = 'black@0.0' if scene['background'] == 'transparent' else scene['background']
+    filters = []
+    tracks = {}
+    work_dir = tempfile.mkdtemp(prefix="celebration_graph_")
+    commands_path = os.path.join(work_dir, "commands.txt")
+    
+    with timing.stage('graph_build') as record:
+        # Every particle gets its own lerp color, so snap them to the graph
+        # palette; particles in one color and size bucket share a source
+        steps = GRAPH_PALETTE_COLORS - 1
+        palette = color_lerp(*scene['particle_colors'], np.round(np.asarray(scene['color_t']) * steps) / steps)
+        sources = {}
+        for i, (particle_size, color) in enumerate(zip(sizes, palette)):
+            bucket = max(1, int(round(particle_size / GRAPH_SIZE_STEP)) * GRAPH_SIZE_STEP)
+            sources.setdefault((color, bucket), []).append(f"p{i}")
+        for (color, particle_size), labels in sources.items():
+            filters.append(_shared_source(f"color=c={color}:s={particle_size}x{particle_size}:d={duration}:r={fps}",
+                                          labels))
         
-        # Fade out like Flutter: (1 - progress)
-        alpha_expr = f"1-t/{duration}"
+        for i in range(len(sizes)):
+            # Linear progress like Flutter, looked up from the keyframe table
+            tracks[f"p{i}"] = confetti['positions'][:, i]
+            x, y = tracks[f"p{i}"][0]
         
-        # Overlay particle
-        if i == 0:
-            input_layer = "bg"
-        else:
-            input_layer = f"tmp{i-1}"
+            # Overlay particle
+            if i == 0:
+                input_layer = "bg"
+            else:
+                input_layer = f"tmp{i-1}"
             
-        filters.append(f"[{input_layer}][p{i}]overlay=x='{x_expr}':y='{y_expr}':eval=frame:format=auto[tmp{i}]")
+            filters.append(f"[{input_layer}][p{i}]overlay@p{i}=x={x:.2f}:y={y:.2f}:eval=init:format=auto[tmp{i}]")
     
-    final_layer = f"tmp{particle_count-1}" if particle_count > 0 else "bg"
+        final_layer = f"tmp{len(sizes)-1}" if sizes else "bg"
     
-    # Add burst rays for uncommon/rare (matching Flutter's _BurstPainter)
-    if 'burst_rays' in effects:
-        ray_count = 48 if rarity == 'rare' else 32  # Match Flutter ray counts
+        # Every ray is the same small rectangle, so they all share one source
+        if ray_count:
+            filters.append(_shared_source(f"color=c={scene['ray_color']}:s=2x20:d={duration}:r={fps}",
+                                          [f"ray{ray}" for ray in range(ray_count)]))
         
         for ray in range(ray_count):
             angle = (2 * math.pi / ray_count) * ray
-            # Flutter: size.shortestSide * 0.15 * progress
-            max_length = 720 * 0.15  # 108px
-            
-            end_x = center_x + math.cos(angle) * max_length
-            end_y = center_y + math.sin(angle) * max_length
-            
-            # Create ray line (simplified as small rectangle)
-            filters.append(f"color=c=#FFD700:s=2x20:d={duration}:r={fps}[ray{ray}]")
-            
-            x_expr = f"{center_x}+({end_x}-{center_x})*t/{duration}"
-            y_expr = f"{center_y}+({end_y}-{center_y})*t/{duration}"
-            
-            filters.append(f"[{final_layer}][ray{ray}]overlay=x='{x_expr}':y='{y_expr}':eval=frame:format=auto[ray_tmp{ray}]")
+            direction = np.float32([math.cos(angle), math.sin(angle)])
+        
+            tracks[f"ray{ray}"] = np.float32([center_x, center_y]) + rays['length'][:, None] * direction
+            x, y = tracks[f"ray{ray}"][0]
+        
+            filters.append(f"[{final_layer}][ray{ray}]overlay@ray{ray}=x={x:.2f}:y={y:.2f}:eval=init:format=auto[ray_tmp{ray}]")
             final_layer = f"ray_tmp{ray}"
     
-    # Build command
-    filter_complex = ";".join(filters)
+        # Base transparent background; sendcmd feeds the keyframe tables to the
+        # overlays (a clip with nothing moving has no commands to send)
+        base = f"color=c={background}:s={width}x{height}:d={duration}:r={fps}"
+        if _write_sendcmd_script(commands_path, tracks, fps):
+            base += f",sendcmd=f='{commands_path}'"
+        filters.insert(0, base + "[bg]")
+    
+        # The graph goes into a script file; it outgrows argv with large presets
+        graph_path = os.path.join(work_dir, "graph.txt")
+        with open(graph_path, 'w') as f:
+            f.write(";\n".join(filters))
+        record['nodes'] = len(filters)
+        record['sources'] = len(sources) + (1 if ray_count else 0)
+        record['particles'] = len(sizes)
+    print(f"   Filter graph: {len(sizes)} particles from {len(sources)} shared sources"
+          f"{f', {ray_count} rays from 1' if ray_count else ''}")
     
     cmd = [
         'ffmpeg', '-y',
-        '-f', 'lavfi', '-i', f'color=c=black@0.0:s={width}x{height}:d={duration}:r={fps}',
-        '-filter_complex', filter_complex,
+        '-f', 'lavfi', '-i', f'color=c={background}:s={width}x{height}:d={duration}:r={fps}',
+        '-filter_complex_script', graph_path,
         '-map', f'[{final_layer}]',
-        '-c:v', 'libx264',
-        '-pix_fmt', 'yuv420p',
-        '-crf', '18',
-        '-preset', 'fast',
-        '-movflags', '+faststart',
+        *output_args,
         output_path
     ]
     
-    print(f"Generating {rarity} celebration video...")
     print(f"Command: {' '.join(cmd[:10])}...")  # Show first part of command
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        result = run_ffmpeg(cmd, timeout=60)
         if result.returncode == 0:
-            print(f"✅ Successfully created {output_path}")
+            print(f"✅ Successfully created {rarity} video")
             return True
         else:
             print(f"❌ FFmpeg error: {result.stderr}")
@@ -147,26 +359,28 @@ def create_celebration_video(rarity, output_path):
         print("   Ubuntu/Debian: sudo apt install ffmpeg")
         print("   macOS: brew install ffmpeg")
         return False
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 def main():
-    # Output directory
-    output_dir = "/home/oliver/Desktop/swapdotz_flutter/assets/celebration_videos"
-    os.makedirs(output_dir, exist_ok=True)
+    parser = argparse.ArgumentParser(description="Generate SwapDotz celebration videos")
+    parser.add_argument("--renderer", choices=["numpy", "ffmpeg"], default="numpy",
+                        help="Frame renderer backend (default: numpy)")
+    parser.add_argument("--output-dir", default="/home/oliver/Desktop/swapdotz_flutter/assets/celebration_videos",
+                        help="Directory for the generated videos")
+    add_farm_arguments(parser, default_seed=42, parity=True)
+    args = parser.parse_args()
     
-    # Generate videos for each rarity
-    rarities = ['common', 'uncommon', 'rare']
+    # Render every rarity/resolution/seed/codec combination in parallel
+    success = run_farm(create_celebration_video, args, variants=seed_variants, renderer=args.renderer)
     
-    for rarity in rarities:
-        output_path = os.path.join(output_dir, f"{rarity}_celebration.mp4")
-        success = create_celebration_video(rarity, output_path)
-        
-        if not success:
-            print(f"Failed to create {rarity} video")
-            return False
+    if not success:
+        print("Some celebration videos failed to render")
+        return False
     
     print("\n🎉 All celebration videos generated successfully!")
-    print(f"Videos saved to: {output_dir}")
+    print(f"Videos saved to: {args.output_dir}")
     return True
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
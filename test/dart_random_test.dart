@@ -0,0 +1,27 @@
+// Known-answer check for dart_random.py, the Python port of math.Random that
+// the celebration video scripts use to reproduce _ConfettiPainter.
+//
+// dart_random_known_answers.json holds the first nextDouble() values the
+// port produces per seed (regenerate with `python dart_random.py --write`);
+// every one must equal what this VM's Random gives for the same seed.
+
+import 'dart:convert';
+import 'dart:io';
+import 'dart:math' as math;
+
+import 'package:flutter_test/flutter_test.dart';
+
+void main() {
+  test('dart_random.py reproduces math.Random', () {
+    final fixture = jsonDecode(File('test/dart_random_known_answers.json').readAsStringSync());
+    final seeds = fixture['next_double'] as Map<String, dynamic>;
+    expect(seeds, isNotEmpty);
+
+    seeds.forEach((seed, values) {
+      final rnd = math.Random(int.parse(seed));
+      for (final value in values as List<dynamic>) {
+        expect(rnd.nextDouble(), (value as num).toDouble(), reason: 'Random($seed)');
+      }
+    });
+  });
+}